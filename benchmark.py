@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# Headless benchmark for tty_color_editor: runs ColorEditor against a fake curses
+# screen and a fake VT stdout, replaying scripted key sequences for every state.
+#
+#   python3 benchmark.py                      # print a table
+#   python3 benchmark.py -o results.json      # also save JSON
+#   python3 benchmark.py --compare old.json   # show changes against an earlier run
+import argparse
+import contextlib
+import curses
+import gzip
+import json
+import os
+import platform
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+import tty_color_editor as tce
+
+BENCH_VERSION = 1
+ESC, ENTER = 27, ord('\n')
+UP, DOWN, LEFT, RIGHT = curses.KEY_UP, curses.KEY_DOWN, curses.KEY_LEFT, curses.KEY_RIGHT
+
+class ScriptDone(Exception):
+    pass
+
+class FakeTerminal:
+    # Virtual screen + what the "terminal" currently shows. doupdate() diffs the two the way
+    # curses does and estimates the bytes a VT would receive (cursor moves, SGR changes, UTF-8 text).
+    def __init__(self, height, width):
+        self.height, self.width = height, width
+        self.blank = (" ", 0)
+        self.virtual = [[self.blank] * width for _ in range(height)]
+        self.physical = [[self.blank] * width for _ in range(height)]
+        self.clear_pending = True
+        self.bytes = 0
+        self.frames = 0
+        self.on_paint = None
+
+    def doupdate(self):
+        out = 0
+        if self.clear_pending:
+            out += len("\033[H\033[J")
+            self.physical = [[self.blank] * self.width for _ in range(self.height)]
+            self.clear_pending = False
+        attr = 0
+        for y in range(self.height):
+            want, have = self.virtual[y], self.physical[y]
+            x = 0
+            while x < self.width:
+                if want[x] == have[x]:
+                    x += 1
+                    continue
+                out += len(f"\033[{y + 1};{x + 1}H")
+                while x < self.width and want[x] != have[x]:
+                    ch, a = want[x]
+                    if a != attr:
+                        out += len("\033[0;7;1m")
+                        attr = a
+                    out += len(ch.encode())
+                    x += 1
+            self.physical[y] = list(want)
+        self.bytes += out
+        self.frames += 1
+        if self.on_paint: self.on_paint()
+
+class FakeWindow:
+    def __init__(self, term, height, width, y=0, x=0):
+        self.term = term
+        self.h, self.w, self.y, self.x = height, width, y, x
+        self.cells = [[term.blank] * width for _ in range(height)]
+        self.touched = True
+
+    def getmaxyx(self):
+        return self.h, self.w
+
+    def erase(self):
+        self.cells = [[self.term.blank] * self.w for _ in range(self.h)]
+        self.touched = True
+
+    def clear(self):
+        self.erase()
+        self.term.clear_pending = True
+
+    def addstr(self, y, x, text, attr=0):
+        row = self.cells[y]
+        for i, ch in enumerate(text):
+            if x + i >= self.w: raise curses.error("addstr past the window edge")
+            row[x + i] = (ch, attr)
+        self.touched = True
+        if x + len(text) >= self.w: raise curses.error("cursor moved past the last cell")
+
+    def touchwin(self):
+        self.touched = True
+
+    def noutrefresh(self):
+        if not self.touched: return
+        for r in range(self.h):
+            for c in range(self.w):
+                if 0 <= self.y + r < self.term.height and 0 <= self.x + c < self.term.width:
+                    self.term.virtual[self.y + r][self.x + c] = self.cells[r][c]
+        self.touched = False
+
+    def refresh(self):
+        self.noutrefresh()
+        self.term.doupdate()
+
+class FakeStdscr(FakeWindow):
+    # Keys arrive in batches: a blocking getch() opens the next batch, nodelay reads drain it
+    def __init__(self, term, batches):
+        super().__init__(term, term.height, term.width)
+        self.batches = [list(b) for b in batches]
+        self.pending = []
+        self.no_delay = False
+        self.input_at = None
+
+    def nodelay(self, flag):
+        self.no_delay = flag
+
+    def timeout(self, ms):
+        pass
+
+    def keypad(self, flag):
+        pass
+
+    def getch(self):
+        if self.pending: return self.pending.pop(0)
+        if self.no_delay: return -1
+        if not self.batches: raise ScriptDone()
+        self.pending = self.batches.pop(0)
+        self.input_at = time.perf_counter()
+        return self.pending.pop(0)
+
+class RecordingStream:
+    def __init__(self):
+        self.bytes = self.writes = self.flushes = 0
+
+    def write(self, text):
+        self.bytes += len(text.encode())
+        self.writes += 1
+        return len(text)
+
+    def flush(self):
+        self.flushes += 1
+
+    def fileno(self):
+        raise OSError("not a terminal")
+
+class RecordingConsole:
+    def __init__(self):
+        self.calls = 0
+
+    def set_font(self, font):
+        self.calls += 1
+
+    def set_unimap(self, pairs):
+        self.calls += 1
+
+    def get_font(self):
+        return tce.PSFFont(8, 16, 256, bytes(256 * tce.KERNEL_GLYPH_ROWS), None)
+
+    def get_unimap(self):
+        return []
+
+def make_fonts(font_dir):
+    # Synthetic PSF2 fonts: a few charsets x families x sizes, enough to exercise the FONTS panel
+    for charset in ("Lat15", "Lat2", "Uni2", "CyrSlav"):
+        for family in ("Fixed", "Terminus", "VGA", "Goha", "Fira"):
+            for bold in ("", "Bold"):
+                for width, height in ((8, 14), (8, 16), (12, 24), (16, 32)):
+                    glyph_bytes = (width + 7) // 8 * height
+                    header = struct.pack("<4s7I", tce.PSF2_MAGIC, 0, 32, 0, 256, glyph_bytes, height, width)
+                    name = f"{charset}-{family}{bold}{height}x{width}.psf.gz"
+                    with gzip.open(os.path.join(font_dir, name), 'wb') as f: f.write(header + bytes(256 * glyph_bytes))
+
+@contextlib.contextmanager
+def fake_environment(workdir, term):
+    stream = RecordingStream()
+    console = RecordingConsole()
+    spawns = []
+    def fake_run(cmd, *args, **kwargs):
+        spawns.append(cmd)
+        return subprocess.CompletedProcess(cmd, 0)
+    patches = [
+        (curses, "curs_set", lambda n: None), (curses, "start_color", lambda: None),
+        (curses, "has_colors", lambda: True), (curses, "use_default_colors", lambda: None),
+        (curses, "init_pair", lambda *a: None), (curses, "color_pair", lambda n: n << 8),
+        (curses, "newwin", lambda h, w, y=0, x=0: FakeWindow(term, h, w, y, x)),
+        (curses, "doupdate", term.doupdate),
+        (tce.subprocess, "run", fake_run), (tce, "FONT_DIR", os.path.join(workdir, "fonts")),
+        (tce, "FONT_LOADER", tce.FontLoader(console)), (sys, "stdout", stream),
+    ]
+    saved = [(obj, name, getattr(obj, name)) for obj, name, _ in patches]
+    env = {"HOME": os.path.join(workdir, "home"), "XDG_CACHE_HOME": os.path.join(workdir, "cache"),
+           "TTY_THEME_LIBRARY": os.path.join(workdir, "themes")}
+    saved_env = {k: os.environ.get(k) for k in env}
+    cwd = os.getcwd()
+    try:
+        for obj, name, value in patches: setattr(obj, name, value)
+        os.environ.update(env)
+        os.chdir(env["HOME"])
+        yield stream, console, spawns
+    finally:
+        os.chdir(cwd)
+        for obj, name, value in saved: setattr(obj, name, value)
+        for k, v in saved_env.items():
+            if v is None: os.environ.pop(k, None)
+            else: os.environ[k] = v
+
+def one_per_batch(*keys):
+    return [[k] for k in keys]
+
+def in_bursts(keys, size):
+    return [list(keys[i:i + size]) for i in range(0, len(keys), size)]
+
+def scenarios():
+    n_presets = len(tce.PRESETS)
+    return {
+        "list_navigation": one_per_batch(*[DOWN] * 32, *[UP] * 16),
+        "edit_hold_right_255": one_per_batch(ENTER, *[RIGHT] * 255, ENTER),
+        "edit_hold_right_255_burst8": [[ENTER]] + in_bursts([RIGHT] * 255, 8) + [[ENTER]],
+        "edit_channels": one_per_batch(ENTER, *[DOWN, RIGHT, RIGHT, LEFT] * 6, ENTER),
+        "cycle_presets": one_per_batch(*[ord('p'), DOWN, ENTER] * n_presets),
+        "sweep_brightness": one_per_batch(*[ord('[')] * 18, *[ord(']')] * 38),
+        "adjust_sliders": one_per_batch(ord('a'), *([RIGHT] * 10 + [DOWN]) * len(tce.ADJUST_PARAMS), ESC),
+        "scroll_gallery": one_per_batch(ord('p'), *[DOWN] * 40, *[UP] * 10, ESC),
+        "search_gallery": one_per_batch(ord('p'), ord('/'), ord('n'), ord('o'), 127, 127, ord('d'), ENTER),
+        "contrast_matrix": one_per_batch(ord('m'), *[DOWN] * 8, *[RIGHT] * 8, ESC, ENTER, *[RIGHT] * 16, ENTER, ord('m'), ESC),
+        "nearest_themes": one_per_batch(ord('n'), DOWN, DOWN, ENTER, ord('p'), ord('n'), ESC),
+        "scroll_font_families": one_per_batch(ord('f'), DOWN, *[RIGHT] * 20, DOWN, *[RIGHT] * 4, ENTER),
+        "scroll_font_charsets": one_per_batch(ord('f'), *[RIGHT] * 8, ESC),
+        "cursor_settings": one_per_batch(ord('c'), *[RIGHT] * 7, DOWN, RIGHT, RIGHT, ESC),
+        "install": one_per_batch(ord('i'), ord('i'), ord('i'), ESC),
+        "undo_redo": one_per_batch(ord('p'), DOWN, ENTER, ord(']'), ord('u'), ord('u'), 18, 18),
+    }
+
+def percentile(values, pct):
+    if not values: return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+def run_scenario(name, batches, workdir, size):
+    term = FakeTerminal(*size)
+    stdscr = FakeStdscr(term, batches)
+    latencies = []
+    def on_paint():
+        if stdscr.input_at is not None:
+            latencies.append(time.perf_counter() - stdscr.input_at)
+            stdscr.input_at = None
+    term.on_paint = on_paint
+    with fake_environment(workdir, term) as (stream, console, spawns):
+        t0 = time.perf_counter()
+        app = tce.ColorEditor(stdscr, fade_duration=0) # fades are wall-clock driven; keep runs comparable
+        app.accelerate = False # burst scenarios would accelerate; keep every key one step
+        startup = time.perf_counter() - t0
+        t1 = time.perf_counter()
+        try:
+            app.run()
+        except ScriptDone:
+            pass
+        wall = time.perf_counter() - t1
+    keys = sum(len(b) for b in batches)
+    total_bytes = term.bytes + stream.bytes
+    return {
+        "keys": keys,
+        "batches": len(batches),
+        "frames": term.frames,
+        "startup_ms": round(startup * 1e3, 3),
+        "wall_ms": round(wall * 1e3, 3),
+        "per_key_ms": round(wall * 1e3 / keys, 4),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1e3, 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50) * 1e3, 4),
+            "p95": round(percentile(latencies, 95) * 1e3, 4),
+            "max": round(max(latencies, default=0.0) * 1e3, 4),
+        },
+        "screen_bytes": term.bytes,
+        "stdout_bytes": stream.bytes,
+        "bytes_per_key": round(total_bytes / keys, 1),
+        "writes": stream.writes,
+        "flushes": stream.flushes,
+        "spawns": len(spawns),
+        "font_ioctls": console.calls,
+    }
+
+def run_all(size, only=None, repeat=1):
+    workdir = tempfile.mkdtemp(prefix="tty_bench_")
+    try:
+        for sub in ("fonts", "home", "cache", "themes"): os.makedirs(os.path.join(workdir, sub))
+        make_fonts(os.path.join(workdir, "fonts"))
+        results = {}
+        for name, batches in scenarios().items():
+            if only and name not in only: continue
+            # Best of N by wall time; the first run also primes the on-disk font index
+            runs = [run_scenario(name, batches, workdir, size) for _ in range(repeat)]
+            results[name] = min(runs, key=lambda r: r["wall_ms"])
+        return results
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+COLUMNS = [("keys", "keys"), ("frames", "frames"), ("per_key_ms", "ms/key"), ("latency_ms.p95", "p95 ms"),
+           ("bytes_per_key", "B/key"), ("flushes", "flushes"), ("spawns", "spawns")]
+
+def metric(result, path):
+    for part in path.split("."): result = result[part]
+    return result
+
+def print_table(results, baseline=None):
+    print(f"{'scenario':<28}" + "".join(f"{label:>10}" for _, label in COLUMNS))
+    for name, result in results.items():
+        print(f"{name:<28}" + "".join(f"{metric(result, path):>10}" for path, _ in COLUMNS))
+        old = (baseline or {}).get(name)
+        if old:
+            cells = []
+            for path, _ in COLUMNS:
+                a, b = metric(old, path), metric(result, path)
+                cells.append(f"{(b - a) / a * 100:+9.0f}%" if a else f"{'-':>10}")
+            print(f"{'  vs baseline':<28}" + "".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless tty_color_editor benchmark")
+    parser.add_argument("-o", "--output", help="save results as JSON")
+    parser.add_argument("--compare", help="earlier JSON results to diff against")
+    parser.add_argument("-s", "--scenario", action="append", help="run only these scenarios")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="runs per scenario, best is kept")
+    parser.add_argument("--size", default="25x80", help="screen size ROWSxCOLS")
+    args = parser.parse_args()
+    size = tuple(int(n) for n in args.size.split("x"))
+
+    results = run_all(size, args.scenario, args.repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f: baseline = json.load(f)["scenarios"]
+    print_table(results, baseline)
+    if args.output:
+        report = {
+            "bench_version": BENCH_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": tce.np is not None,
+            "screen": args.size,
+            "scenarios": results,
+        }
+        with open(args.output, 'w') as f: json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
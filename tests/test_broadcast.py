@@ -0,0 +1,74 @@
+import os
+import pty
+import select
+import time
+import tty
+import unittest
+
+import tty_color_editor as tce
+
+class PtyTarget:
+    # A pty pair standing in for a virtual console: the editor writes to the slave path,
+    # the test reads what arrived from the master side
+    def __init__(self):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        self.path = os.ttyname(self.slave)
+
+    def read(self, size):
+        data = b""
+        while len(data) < size: data += os.read(self.master, size - len(data))
+        return data
+
+    def fill(self):
+        # Stop draining the master so the slave's output buffer fills up, like a ^S'd console.
+        # The kernel moves pty data across in the background, so keep going until it stays full.
+        os.set_blocking(self.slave, False)
+        while select.select([], [self.slave], [], 0.1)[1]:
+            try:
+                while True: os.write(self.slave, b"x" * 4096)
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+class BroadcastPaletteTest(unittest.TestCase):
+    def setUp(self):
+        self.ptys = [PtyTarget() for _ in range(3)]
+
+    def tearDown(self):
+        for p in self.ptys: p.close()
+
+    def test_every_target_gets_the_same_payload(self):
+        entries = {1: "ff0000", 0: "000000", 15: "FFFFFF", 16: "123456"}
+        expected = b"\033]P0000000\033]P1FF0000\033]PFFFFFFF"
+        results = tce.broadcast_palette(entries, [p.path for p in self.ptys])
+        self.assertEqual(results, {p.path: None for p in self.ptys})
+        for p in self.ptys: self.assertEqual(p.read(len(expected)), expected)
+
+    def test_missing_path_is_reported_per_target(self):
+        missing = "/dev/tty-does-not-exist"
+        results = tce.broadcast_palette({1: "FF0000"}, [self.ptys[0].path, missing])
+        self.assertEqual(list(results), [self.ptys[0].path, missing])
+        self.assertIsNone(results[self.ptys[0].path])
+        self.assertEqual(results[missing], "No such file or directory")
+        self.assertIn(f"{missing}: No such file or directory", tce.broadcast_summary(results))
+        self.assertTrue(tce.broadcast_summary(results).startswith("Palette sent to 1/2 consoles"))
+
+    def test_full_buffer_times_out_without_holding_up_others(self):
+        stuck, ok = self.ptys[0], self.ptys[1]
+        stuck.fill()
+        started = time.monotonic()
+        results = tce.broadcast_palette({1: "FF0000"}, [stuck.path, ok.path], timeout=0.2)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(results[stuck.path], "timed out after 0.2s")
+        self.assertIsNone(results[ok.path])
+        self.assertEqual(ok.read(10), b"\033]P1FF0000")
+
+    def test_no_targets(self):
+        self.assertEqual(tce.broadcast_palette({1: "FF0000"}, []), {})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import gzip
+import os
+import struct
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+import tty_color_editor as tce
+
+def psf1(charsize, glyphs=256, table=None):
+    mode = (0x01 if glyphs == 512 else 0) | (0x02 if table is not None else 0)
+    data = tce.PSF1_MAGIC + bytes([mode, charsize])
+    data += b"".join(bytes([g % 256]) * charsize for g in range(glyphs))
+    if table is not None:
+        for entries in table: data += b"".join(struct.pack("<H", u) for u in entries) + b"\xff\xff"
+    return data
+
+def psf2(width, height, glyphs=256, table=None):
+    row_bytes = (width + 7) // 8
+    glyph_bytes = row_bytes * height
+    header = struct.pack("<4s7I", tce.PSF2_MAGIC, 0, 32, 1 if table is not None else 0, glyphs, glyph_bytes, height, width)
+    data = header + b"".join(bytes([g % 256]) * glyph_bytes for g in range(glyphs))
+    if table is not None: data += b"".join(entry + b"\xff" for entry in table)
+    return data
+
+class RecordingConsole:
+    # Stands in for LinuxConsole: records what would have gone to the ioctls
+    def __init__(self, font=None, unimap=()):
+        self.fonts, self.unimaps = [], []
+        self.font, self.unimap = font, list(unimap)
+
+    def set_font(self, font):
+        self.fonts.append(font)
+
+    def set_unimap(self, pairs):
+        self.unimaps.append(pairs)
+
+    def get_font(self):
+        if self.font is None: raise OSError("not a console")
+        return self.font
+
+    def get_unimap(self):
+        return self.unimap
+
+class ParsePSFTest(unittest.TestCase):
+    def test_psf1_pads_glyphs_to_kernel_rows(self):
+        font = tce.parse_psf(psf1(16))
+        self.assertEqual((font.width, font.height, font.charcount), (8, 16, 256))
+        self.assertEqual(len(font.glyphs), 256 * tce.KERNEL_GLYPH_ROWS)
+        glyph = font.glyphs[65 * tce.KERNEL_GLYPH_ROWS:66 * tce.KERNEL_GLYPH_ROWS]
+        self.assertEqual(glyph, bytes([65]) * 16 + bytes(16))
+        self.assertIsNone(font.unimap)
+
+    def test_psf1_unicode_table_skips_sequences(self):
+        table = [[0x41, 0xC0, 0xFFFE, 0x41, 0x300]] + [[]] * 511
+        font = tce.parse_psf(psf1(8, glyphs=512, table=table))
+        self.assertEqual(font.charcount, 512)
+        self.assertEqual(font.unimap, [(0x41, 0), (0xC0, 0)])
+
+    def test_psf2_wide_glyphs_and_utf8_table(self):
+        # glyph 1 maps U+2500 and the sequence A + combining grave, which the kernel table cannot hold
+        table = ["A\u00c0".encode(), "\u2500".encode() + b"\xfe" + "A\u0300".encode()] + [b""] * 254
+        font = tce.parse_psf(psf2(12, 24, table=table))
+        self.assertEqual((font.width, font.height, font.charcount), (12, 24, 256))
+        self.assertEqual(len(font.glyphs), 256 * 2 * tce.KERNEL_GLYPH_ROWS)
+        self.assertEqual(font.glyphs[2 * 24:2 * tce.KERNEL_GLYPH_ROWS], bytes(2 * (tce.KERNEL_GLYPH_ROWS - 24)))
+        self.assertEqual(font.unimap, [(0x41, 0), (0xC0, 0), (0x2500, 1)])
+
+    def test_rejects_fonts_the_console_cannot_hold(self):
+        with self.assertRaises(ValueError): tce.parse_psf(psf2(8, tce.KERNEL_GLYPH_ROWS + 1))
+        with self.assertRaises(ValueError): tce.parse_psf(psf2(8, 16)[:100])
+        with self.assertRaises(ValueError): tce.parse_psf(b"not a font")
+
+class FontLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.console = RecordingConsole()
+        self.loader = tce.FontLoader(self.console)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, name, data, compress=True):
+        path = os.path.join(self.dir.name, name)
+        with (gzip.open if compress else open)(path, 'wb') as f: f.write(data)
+        return path
+
+    def test_loads_through_the_console_and_caches(self):
+        path = self.write("Uni2-Test16.psf.gz", psf1(16, table=[[0x41]] + [[]] * 255))
+        with mock.patch.object(tce.subprocess, "run") as run:
+            self.assertEqual(self.loader.load(path), "ioctl")
+            self.assertEqual(self.loader.load(path), "ioctl")
+        run.assert_not_called()
+        self.assertEqual(len(self.console.fonts), 2)
+        self.assertIs(self.console.fonts[0], self.console.fonts[1])
+        self.assertEqual(self.console.unimaps, [[(0x41, 0)], [(0x41, 0)]])
+
+    def test_falls_back_to_setfont(self):
+        corrupt = bytearray(gzip.compress(psf1(16)))
+        corrupt[20:40] = bytes(b ^ 0xFF for b in corrupt[20:40])
+        cases = {
+            "corrupt": self.write("corrupt.psf.gz", bytes(corrupt), compress=False),
+            "truncated": self.write("truncated.psf.gz", gzip.compress(psf1(16))[:30], compress=False),
+            "too tall": self.write("tall.psf.gz", psf2(8, tce.KERNEL_GLYPH_ROWS + 1)),
+            "missing": os.path.join(self.dir.name, "missing.psf.gz"),
+        }
+        for label, path in cases.items():
+            with self.subTest(label), mock.patch.object(tce.subprocess, "run") as run:
+                self.assertEqual(self.loader.load(path), "setfont")
+                run.assert_called_once_with(["setfont", path], check=True)
+        self.assertEqual(self.console.fonts, [])
+
+    def test_reports_failure_when_setfont_fails_too(self):
+        failed = subprocess.CalledProcessError(1, "setfont")
+        with mock.patch.object(tce.subprocess, "run", side_effect=failed):
+            self.assertIsNone(self.loader.load(os.path.join(self.dir.name, "missing.psf.gz")))
+
+    def test_save_and_restore(self):
+        font = tce.parse_psf(psf1(16))
+        self.console.font, self.console.unimap = font, [(0x41, 65)]
+        saved = self.loader.save()
+        self.assertIs(saved, font)
+        self.loader.restore(saved)
+        self.assertEqual(self.console.fonts, [font])
+        self.assertEqual(self.console.unimaps, [[(0x41, 65)]])
+        self.assertIsNone(tce.FontLoader(RecordingConsole()).save())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,32 @@ import os
 import json
 import re
 import subprocess
+import time
+import gzip
+import zlib
+import struct
+import fcntl
+import ctypes
+import collections
+import collections.abc
+import functools
+import math
+import array
+import hashlib
+import argparse
+import multiprocessing
+import plistlib
+import heapq
+import difflib
+import shlex
+import threading
+import select
+import concurrent.futures
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # Standard Linux Console Colors (0-15)
 
@@ -64,6 +90,40 @@ USAGE_HINTS = [
     "Bold Blue", "Bold Magenta", "Bold Cyan", "Bold White"
 ]
 
+# Keys whose autorepeat runs are merged into one signed step per frame
+KEY_AXES = {
+    curses.KEY_UP: ('UD', -1), curses.KEY_DOWN: ('UD', 1),
+    curses.KEY_LEFT: ('LR', -1), curses.KEY_RIGHT: ('LR', 1),
+    ord('['): ('BRIGHT', -1), ord(']'): ('BRIGHT', 1),
+}
+MAX_KEY_BATCH = 256
+HOLD_GAP = 0.15         # seconds between repeats that still count as "held"
+HOLD_ACCEL_EVERY = 12   # repeats per extra step of acceleration
+MAX_HOLD_STEP = 8
+
+# ADJUST panel: (label, Adjustments field, step, min, max)
+ADJUST_PARAMS = [
+    ("Brightness", "brightness", 0.05, 0.1, 2.0),
+    ("Contrast", "contrast", 0.05, 0.2, 3.0),
+    ("Gamma", "gamma", 0.05, 0.2, 3.0),
+    ("Saturation", "saturation", 0.05, 0.0, 3.0),
+    ("Hue", "hue", 5, -180, 180),
+    ("Temperature", "temperature", 0.05, -1.0, 1.0),
+]
+
+def coalesce_keys(keys):
+    batch = []
+    for key in keys:
+        if key == -1: continue
+        axis, sign = KEY_AXES.get(key, (None, 0))
+        if axis is None:
+            batch.append((key, 1))
+        elif batch and batch[-1][0] == axis:
+            batch[-1] = (axis, batch[-1][1] + sign)
+        else:
+            batch.append((axis, sign))
+    return [(key, delta) for key, delta in batch if delta]
+
 def hex_to_rgb(hex_str):
     hex_str = hex_str.lstrip('#')
     return tuple(int(hex_str[i:i+2], 16) for i in (0, 2, 4))
@@ -78,44 +138,590 @@ def scale_color(hex_color, brightness):
     b = max(0, min(255, int(b * brightness)))
     return rgb_to_hex(r, g, b)
 
+# -- Palette engine: 16x3 uint8 storage, hex only at the edges --
+
+def clamp8(v):
+    return max(0, min(255, int(v)))
+
+@functools.lru_cache(maxsize=512)
+def channel_lut(kind, value):
+    # 256-entry byte table for one per-channel transform at one setting
+    if kind == "brightness": f = lambda v: clamp8(v * value)  # truncates, like scale_color
+    elif kind == "contrast": f = lambda v: clamp8(round((v - 128) * value + 128))
+    elif kind == "gamma": f = lambda v: clamp8(round(255 * (v / 255) ** (1 / value)))
+    elif kind == "gain": f = lambda v: clamp8(round(v * value))
+    else: raise ValueError(kind)
+    return bytes(f(v) for v in range(256))
+
+IDENTITY_LUT = bytes(range(256))
+
+@functools.lru_cache(maxsize=512)
+def adjustment_luts(brightness, contrast, gamma, temperature):
+    # temperature -> gamma -> contrast -> brightness, composed into one table per channel
+    gains = (1 + 0.2 * temperature, 1.0, 1 - 0.2 * temperature)
+    luts = []
+    for gain in gains:
+        lut = IDENTITY_LUT
+        for kind, value in (("gain", gain), ("gamma", gamma), ("contrast", contrast), ("brightness", brightness)):
+            if value != 1.0: lut = lut.translate(channel_lut(kind, value))
+        luts.append(lut)
+    return tuple(luts)
+
+@functools.lru_cache(maxsize=512)
+def hue_saturation_matrix(hue, saturation):
+    # feColorMatrix hueRotate x saturate, row-major 3x3
+    c, s = math.cos(math.radians(hue)), math.sin(math.radians(hue))
+    h = ((0.213 + c * 0.787 - s * 0.213, 0.715 - c * 0.715 - s * 0.715, 0.072 - c * 0.072 + s * 0.928),
+         (0.213 - c * 0.213 + s * 0.143, 0.715 + c * 0.285 + s * 0.140, 0.072 - c * 0.072 - s * 0.283),
+         (0.213 - c * 0.213 - s * 0.787, 0.715 - c * 0.715 + s * 0.715, 0.072 + c * 0.928 + s * 0.072))
+    k = saturation
+    sat = ((0.213 + 0.787 * k, 0.715 - 0.715 * k, 0.072 - 0.072 * k),
+           (0.213 - 0.213 * k, 0.715 + 0.285 * k, 0.072 - 0.072 * k),
+           (0.213 - 0.213 * k, 0.715 - 0.715 * k, 0.072 + 0.928 * k))
+    return tuple(tuple(sum(h[r][i] * sat[i][col] for i in range(3)) for col in range(3)) for r in range(3))
+
+class Adjustments:
+    # Stackable whole-palette transforms; every field at its default is the identity
+    FIELDS = ("brightness", "contrast", "gamma", "saturation", "hue", "temperature")
+
+    def __init__(self, brightness=1.0, contrast=1.0, gamma=1.0, saturation=1.0, hue=0.0, temperature=0.0):
+        self.brightness, self.contrast, self.gamma = brightness, contrast, gamma
+        self.saturation, self.hue, self.temperature = saturation, hue, temperature
+
+    def key(self):
+        return tuple(getattr(self, f) for f in self.FIELDS)
+
+    def luts(self):
+        b, c, g, _, _, t = self.key()
+        return adjustment_luts(b, c, g, t)
+
+    def matrix(self):
+        _, _, _, sat, hue, _ = self.key()
+        if sat == 1.0 and hue % 360 == 0: return None
+        return hue_saturation_matrix(hue, sat)
+
+class Palette:
+    # 16 RGB entries as a 16x3 uint8 array (NumPy if installed, array('B') otherwise)
+    def __init__(self, data=None):
+        if data is None: data = bytes(48)
+        if np is not None:
+            self.data = np.frombuffer(bytes(data), dtype=np.uint8).reshape(16, 3).copy()
+        else:
+            self.data = array.array('B', bytes(data))
+
+    @classmethod
+    def from_hex(cls, colors):
+        return cls(b"".join(bytes.fromhex(c.lstrip('#')) for c in colors))
+
+    def tobytes(self):
+        return self.data.tobytes()
+
+    def copy(self):
+        return Palette(self.tobytes())
+
+    def rgb(self, index):
+        if np is not None: return tuple(int(v) for v in self.data[index])
+        return tuple(self.data[index * 3:index * 3 + 3])
+
+    def set_rgb(self, index, r, g, b):
+        if np is not None: self.data[index] = (r, g, b)
+        else: self.data[index * 3:index * 3 + 3] = array.array('B', (r, g, b))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice): return [self[i] for i in range(16)[index]]
+        return rgb_to_hex(*self.rgb(index))
+
+    def __setitem__(self, index, hex_color):
+        self.set_rgb(index, *hex_to_rgb(hex_color))
+
+    def __len__(self):
+        return 16
+
+    def __iter__(self):
+        return (self[i] for i in range(16))
+
+    def __eq__(self, other):
+        return isinstance(other, Palette) and self.tobytes() == other.tobytes()
+
+    def transformed(self, adjust):
+        matrix = adjust.matrix()
+        luts = adjust.luts()
+        if np is not None:
+            data = self.data
+            if matrix is not None:
+                data = np.clip(np.rint(data @ np.array(matrix).T), 0, 255).astype(np.uint8)
+            out = np.empty_like(data)
+            for ch in range(3): out[:, ch] = np.frombuffer(luts[ch], dtype=np.uint8)[data[:, ch]]
+            return Palette(out.tobytes())
+        raw = bytearray(self.data.tobytes())
+        if matrix is not None:
+            for i in range(0, 48, 3):
+                rgb = raw[i:i + 3]
+                raw[i:i + 3] = bytes(clamp8(round(sum(row[k] * rgb[k] for k in range(3)))) for row in matrix)
+        for ch in range(3): raw[ch::3] = bytes(raw[ch::3]).translate(luts[ch])
+        return Palette(raw)
+
+def palette_escape(index, hex_color):
+    return f"\033]P{index:X}{hex_color}"
+
 def apply_color(index, hex_color):
     if not (0 <= index <= 15):
         return
-    sys.stdout.write(f"\033]P{index:X}{hex_color}")
+    sys.stdout.write(palette_escape(index, hex_color))
     sys.stdout.flush()
 
-def get_fonts():
-    font_dir = "/usr/share/consolefonts"
-    if not os.path.exists(font_dir):
-        return {}
-    
-    # Structure: { family: { size: { bold: filename, normal: filename } } }
-    parsed = {}
-    
-    pattern = re.compile(r"Lat15-([a-zA-Z]+)(Bold)?([0-9x]+)\.psf\.gz")
-    
-    for f in os.listdir(font_dir):
-        match = pattern.match(f)
-        if match:
-            family, bold_tag, size = match.groups()
-            is_bold = bold_tag is not None
-            
-            if family not in parsed:
-                parsed[family] = {}
-            if size not in parsed[family]:
-                parsed[family][size] = {}
-            
-            key = 'bold' if is_bold else 'normal'
-            parsed[family][size][key] = f
-            
-    return parsed
+class PaletteWriter:
+    # Remembers the palette last sent to the terminal and batches changes made
+    # during a frame into one write + one flush, skipping unchanged entries.
+    # The terminal's starting palette is unknown, so the first write is always
+    # a full resync of every entry queued; only later writes are diffs.
+    def __init__(self, stream=None):
+        self.stream = stream
+        self.sent = [None] * 16
+        self.pending = {}
 
-def apply_font(font_name):
+    def set(self, index, hex_color):
+        if 0 <= index <= 15:
+            self.pending[index] = hex_color.upper()
+
+    def set_all(self, colors):
+        for i, c in enumerate(colors):
+            if i >= 16: break
+            self.set(i, c)
+
+    def flush(self):
+        changed = [(i, c) for i, c in sorted(self.pending.items()) if self.sent[i] != c]
+        self.pending = {}
+        if not changed: return 0
+        stream = self.stream or sys.stdout
+        stream.write("".join(palette_escape(i, c) for i, c in changed))
+        stream.flush()
+        for i, c in changed: self.sent[i] = c
+        return len(changed)
+
+    def sent_colors(self, fallback):
+        # What the terminal shows now, using fallback for entries never sent
+        return [c if c is not None else fallback[i].upper() for i, c in enumerate(self.sent)]
+
+    def resync(self, colors):
+        # Forget what we think the terminal shows (e.g. after another program reset it) and resend everything
+        self.sent = [None] * 16
+        self.set_all(colors)
+        return self.flush()
+
+# Every virtual console keeps its own palette; these push one to many ttys at once
+VT_GETSTATE = 0x5603
+VT_FALLBACK_COUNT = 6
+TTY_WRITE_TIMEOUT = 1.0
+MAX_TTY_WORKERS = 16
+
+def console_ttys():
+    # /dev/ttyN for each allocated VT (VT_GETSTATE only reports 1-15), else the usual 1-6
     try:
-        subprocess.run(["setfont", font_name], check=True)
-    except Exception:
+        fd = os.open("/dev/tty0", os.O_RDONLY | os.O_NOCTTY)
+        try:
+            state = bytearray(6)
+            fcntl.ioctl(fd, VT_GETSTATE, state)
+        finally:
+            os.close(fd)
+        _, _, in_use = struct.unpack("<3H", state)
+        vts = [n for n in range(1, 16) if in_use & (1 << n)]
+    except OSError:
+        vts = range(1, VT_FALLBACK_COUNT + 1)
+    return [f"/dev/tty{n}" for n in vts]
+
+def write_tty(path, payload, timeout=TTY_WRITE_TIMEOUT):
+    # Non-blocking so a stopped (^S) or wedged tty times out instead of hanging a worker
+    deadline = time.monotonic() + timeout
+    fd = os.open(path, os.O_WRONLY | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        view = memoryview(payload)
+        while view:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([], [fd], [], remaining)[1]:
+                raise TimeoutError(f"timed out after {timeout:g}s")
+            try:
+                view = view[os.write(fd, view):]
+            except BlockingIOError:
+                pass
+    finally:
+        os.close(fd)
+
+def broadcast_palette(entries, targets, timeout=TTY_WRITE_TIMEOUT, workers=None):
+    # entries: {index: hex}; the payload is built once and shared by every worker.
+    # Returns {path: error message or None} in target order.
+    payload = "".join(palette_escape(i, c.upper()) for i, c in sorted(entries.items()) if 0 <= i <= 15).encode()
+    def send(path):
+        try:
+            write_tty(path, payload, timeout)
+            return None
+        except OSError as e:
+            return e.strerror or str(e)
+    if not targets: return {}
+    with concurrent.futures.ThreadPoolExecutor(workers or min(MAX_TTY_WORKERS, len(targets))) as pool:
+        return dict(zip(targets, pool.map(send, targets)))
+
+def broadcast_summary(results):
+    failed = [f"{path}: {error}" for path, error in results.items() if error]
+    text = f"Palette sent to {len(results) - len(failed)}/{len(results)} consoles"
+    return text + (" | " + "; ".join(failed) if failed else "")
+
+FONT_DIR = "/usr/share/consolefonts"
+FONT_INDEX_VERSION = 1
+FONT_NAME_RE = re.compile(r"^([A-Za-z0-9]+)-([A-Za-z]+?)(Bold)?([0-9]+(?:x[0-9]+)?)\.psfu?(?:\.gz)?$")
+PSF1_MAGIC = b"\x36\x04"
+PSF2_MAGIC = b"\x72\xb5\x4a\x86"
+
+def cache_file(name):
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "tty_color_editor", name)
+
+def read_psf_header(path):
+    # Returns (width, height, glyph_count, has_unicode_table) or None if not a PSF font
+    opener = gzip.open if path.endswith(".gz") else open
+    try:
+        with opener(path, 'rb') as f: head = f.read(32)
+    except (OSError, EOFError, zlib.error, struct.error):
+        return None
+    if head[:2] == PSF1_MAGIC and len(head) >= 4:
+        mode, charsize = head[2], head[3]
+        return 8, charsize, 512 if mode & 0x01 else 256, bool(mode & 0x06)
+    if head[:4] == PSF2_MAGIC and len(head) >= 32:
+        _, _, flags, length, _, height, width = struct.unpack("<7I", head[4:32])
+        return width, height, length, bool(flags & 0x01)
+    return None
+
+def scan_font(font_dir, filename, st):
+    header = read_psf_header(os.path.join(font_dir, filename))
+    if header is None: return None
+    width, height, glyphs, unicode = header
+    match = FONT_NAME_RE.match(filename)
+    if match:
+        charset, family, bold_tag, _ = match.groups()
+    else:
+        charset, family, bold_tag = "Other", re.sub(r"\.psfu?(\.gz)?$", "", filename), None
+    return {
+        "file": filename, "charset": charset, "family": family, "bold": bold_tag is not None,
+        "width": width, "height": height, "glyphs": glyphs, "unicode": unicode,
+        "mtime": st.st_mtime_ns, "bytes": st.st_size,
+    }
+
+def load_font_index(font_dir=None, cache_path=None):
+    # Index of every PSF font in font_dir, cached on disk and only rescanned when the directory mtime changes
+    font_dir = font_dir or FONT_DIR
+    try:
+        dir_mtime = os.stat(font_dir).st_mtime_ns
+    except OSError:
+        return []
+    cache_path = cache_path or cache_file("fonts.json")
+    cached = {}
+    try:
+        with open(cache_path) as f: cache = json.load(f)
+        if cache.get("version") == FONT_INDEX_VERSION and cache.get("dir") == font_dir:
+            if cache.get("dir_mtime") == dir_mtime:
+                return cache["fonts"]
+            cached = {e["file"]: e for e in cache["fonts"]}
+    except (OSError, ValueError, KeyError, TypeError):
         pass
 
+    fonts = []
+    for entry in os.scandir(font_dir):
+        if not entry.is_file() or ".psf" not in entry.name: continue
+        st = entry.stat()
+        old = cached.get(entry.name)
+        if old and old.get("mtime") == st.st_mtime_ns and old.get("bytes") == st.st_size:
+            fonts.append(old)
+            continue
+        info = scan_font(font_dir, entry.name, st)
+        if info: fonts.append(info)
+    fonts.sort(key=lambda e: e["file"])
+
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": FONT_INDEX_VERSION, "dir": font_dir, "dir_mtime": dir_mtime, "fonts": fonts}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+    return fonts
+
+def font_size_key(size):
+    width, height = (int(n) for n in size.split("x"))
+    return height, width
+
+def get_fonts(index, charset):
+    # Structure: { family: { "WxH": { bold: entry, normal: entry } } }, sizes in ascending order
+    parsed = {}
+    for e in index:
+        if e["charset"] != charset: continue
+        size = f"{e['width']}x{e['height']}"
+        parsed.setdefault(e["family"], {}).setdefault(size, {})['bold' if e["bold"] else 'normal'] = e
+    for family, sizes in parsed.items():
+        parsed[family] = {size: sizes[size] for size in sorted(sizes, key=font_size_key)}
+    return parsed
+
+# Linux console ioctls (linux/kd.h)
+KDFONTOP = 0x4B72
+KD_FONT_OP_SET = 0
+KD_FONT_OP_GET = 1
+PIO_FONTX = 0x4B6C
+GIO_UNIMAP = 0x4B66
+PIO_UNIMAP = 0x4B67
+PIO_UNIMAPCLR = 0x4B68
+KERNEL_GLYPH_ROWS = 32  # the kernel wants every glyph padded to 32 rows
+KERNEL_GLYPH_WIDTH = 32
+MAX_UNIMAP_ENTRIES = 0xFFFF
+FONT_CACHE_SIZE = 8
+
+class ConsoleFontOp(ctypes.Structure):
+    _fields_ = [("op", ctypes.c_uint), ("flags", ctypes.c_uint), ("width", ctypes.c_uint),
+                ("height", ctypes.c_uint), ("charcount", ctypes.c_uint), ("data", ctypes.c_void_p)]
+
+class ConsoleFontDesc(ctypes.Structure):
+    _fields_ = [("charcount", ctypes.c_ushort), ("charheight", ctypes.c_ushort), ("chardata", ctypes.c_void_p)]
+
+class UnimapInit(ctypes.Structure):
+    _fields_ = [("advised_hashsize", ctypes.c_ushort), ("advised_hashstep", ctypes.c_ushort), ("advised_hashlevel", ctypes.c_ushort)]
+
+class UnimapDesc(ctypes.Structure):
+    _fields_ = [("entry_ct", ctypes.c_ushort), ("entries", ctypes.c_void_p)]
+
+class PSFFont:
+    def __init__(self, width, height, charcount, glyphs, unimap):
+        self.width, self.height, self.charcount = width, height, charcount
+        self.glyphs = glyphs    # charcount glyphs, each padded to KERNEL_GLYPH_ROWS rows
+        self.unimap = unimap    # [(codepoint, glyph)] or None if the font has no Unicode table
+
+def parse_psf(data):
+    if data[:2] == PSF1_MAGIC:
+        mode, charsize = data[2], data[3]
+        width, height, charcount, offset, has_table = 8, charsize, 512 if mode & 0x01 else 256, 4, mode & 0x06
+    elif data[:4] == PSF2_MAGIC:
+        _, offset, flags, charcount, charsize, height, width = struct.unpack("<7I", data[4:32])
+        has_table = flags & 0x01
+    else:
+        raise ValueError("not a PSF font")
+    if height > KERNEL_GLYPH_ROWS or charcount > 512:
+        raise ValueError(f"{width}x{height} font with {charcount} glyphs does not fit the console font slot")
+
+    row_bytes = (width + 7) // 8
+    glyph_bytes = row_bytes * height
+    table_start = offset + charcount * glyph_bytes
+    if len(data) < table_start: raise ValueError("truncated PSF font")
+    pad = bytes(row_bytes * (KERNEL_GLYPH_ROWS - height))
+    glyphs = b"".join(data[offset + i * glyph_bytes:offset + (i + 1) * glyph_bytes] + pad for i in range(charcount))
+
+    unimap = None
+    if has_table:
+        unimap = []
+        pos = table_start
+        if data[:2] == PSF1_MAGIC:
+            for glyph in range(charcount):
+                in_seq = False
+                while pos + 2 <= len(data):
+                    (u,) = struct.unpack_from("<H", data, pos); pos += 2
+                    if u == 0xFFFF: break
+                    if u == 0xFFFE: in_seq = True
+                    elif not in_seq: unimap.append((u, glyph))
+        else:
+            for glyph in range(charcount):
+                end = data.find(b"\xff", pos)
+                if end < 0: break
+                singles = data[pos:end].split(b"\xfe", 1)[0]
+                unimap.extend((ord(ch), glyph) for ch in singles.decode("utf-8", "ignore") if ord(ch) <= 0xFFFF)
+                pos = end + 1
+    return PSFFont(width, height, charcount, glyphs, unimap)
+
+class LinuxConsole:
+    # Thin ioctl layer; swap it for a recording fake to exercise FontLoader off a real VT
+    def __init__(self, fd=None):
+        self.fd = fd
+
+    def ioctl(self, request, arg):
+        fd = self.fd if self.fd is not None else sys.stdout.fileno()
+        fcntl.ioctl(fd, request, arg)
+
+    def set_font(self, font):
+        buf = ctypes.create_string_buffer(font.glyphs, len(font.glyphs))
+        try:
+            self.ioctl(KDFONTOP, ConsoleFontOp(KD_FONT_OP_SET, 0, font.width, font.height, font.charcount, ctypes.addressof(buf)))
+        except OSError:
+            # Pre-2.6 kernels (and some emulations) only know the 8-pixel-wide PIO_FONTX call
+            if font.width != 8: raise
+            self.ioctl(PIO_FONTX, ConsoleFontDesc(font.charcount, font.height, ctypes.addressof(buf)))
+
+    def set_unimap(self, pairs):
+        entries = (ctypes.c_ushort * (2 * len(pairs)))(*(n for pair in pairs for n in pair))
+        self.ioctl(PIO_UNIMAPCLR, UnimapInit(0, 0, 0))
+        self.ioctl(PIO_UNIMAP, UnimapDesc(len(pairs), ctypes.addressof(entries)))
+
+    def get_font(self):
+        size = 512 * KERNEL_GLYPH_ROWS * (KERNEL_GLYPH_WIDTH // 8)
+        buf = ctypes.create_string_buffer(size)
+        op = ConsoleFontOp(KD_FONT_OP_GET, 0, KERNEL_GLYPH_WIDTH, KERNEL_GLYPH_ROWS, 512, ctypes.addressof(buf))
+        self.ioctl(KDFONTOP, op)
+        glyph_bytes = (op.width + 7) // 8 * KERNEL_GLYPH_ROWS
+        return PSFFont(op.width, op.height, op.charcount, buf.raw[:op.charcount * glyph_bytes], None)
+
+    def get_unimap(self):
+        entries = (ctypes.c_ushort * (2 * MAX_UNIMAP_ENTRIES))()
+        desc = UnimapDesc(MAX_UNIMAP_ENTRIES, ctypes.addressof(entries))
+        self.ioctl(GIO_UNIMAP, desc)
+        return [(entries[2 * i], entries[2 * i + 1]) for i in range(desc.entry_ct)]
+
+class FontLoader:
+    # Loads PSF fonts in-process with an LRU cache of decoded glyphs; falls back to setfont
+    def __init__(self, console=None, cache_size=FONT_CACHE_SIZE):
+        self.console = console or LinuxConsole()
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+
+    def resolve(self, font_name):
+        if os.sep in font_name: return font_name
+        return os.path.join(FONT_DIR, font_name)
+
+    def decode(self, path):
+        st = os.stat(path)
+        key = (path, st.st_mtime_ns, st.st_size)
+        font = self.cache.get(key)
+        if font is not None:
+            self.cache.move_to_end(key)
+            return font
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, 'rb') as f: font = parse_psf(f.read())
+        self.cache[key] = font
+        while len(self.cache) > self.cache_size: self.cache.popitem(last=False)
+        return font
+
+    def load(self, font_name):
+        try:
+            font = self.decode(self.resolve(font_name))
+            self.console.set_font(font)
+            if font.unimap: self.console.set_unimap(font.unimap)
+            return "ioctl"
+        except (OSError, EOFError, zlib.error, ValueError, struct.error):
+            pass # truncated/corrupt .gz raises EOFError or zlib.error
+        try:
+            subprocess.run(["setfont", font_name], check=True)
+            return "setfont"
+        except Exception:
+            return None
+
+    def save(self):
+        # Snapshot what the console shows now, so a preview can be undone exactly
+        try:
+            font = self.console.get_font()
+            font.unimap = self.console.get_unimap()
+            return font
+        except OSError:
+            return None
+
+    def restore(self, font):
+        self.console.set_font(font)
+        if font.unimap: self.console.set_unimap(font.unimap)
+
+FONT_LOADER = FontLoader()
+
+def apply_font(font_name, loader=None):
+    return (loader or FONT_LOADER).load(font_name)
+
+FONT_PREVIEW_DELAY = 0.15   # seconds the selection must sit still before a preview load
+FONT_PREVIEW_POLL_MS = 50   # getch timeout while a preview is outstanding
+
+class FontPreviewer:
+    # Loads the highlighted font on a worker thread once the selection has been
+    # still for `delay` seconds. A newer request replaces a pending one, so
+    # scrolling through fonts only ever loads the one you stop on.
+    def __init__(self, loader=None, delay=FONT_PREVIEW_DELAY):
+        self.loader = loader or FONT_LOADER
+        self.delay = delay
+        self.cond = threading.Condition()
+        self.wanted = None
+        self.due = 0.0
+        self.busy = False
+        self.closed = False
+        self.results = []
+        self.original = None
+        self.touched = False
+        self.thread = None
+
+    def request(self, font_name):
+        with self.cond:
+            self.wanted = font_name
+            self.due = time.monotonic() + self.delay
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.worker, name="font-preview", daemon=True)
+                self.thread.start()
+            self.cond.notify_all()
+
+    def pending(self):
+        return self.wanted is not None or self.busy
+
+    def poll(self):
+        # (font_name, method) for each load finished since the last poll; method is None on failure
+        with self.cond:
+            results, self.results = self.results, []
+        return results
+
+    def cancel(self):
+        # Drop anything queued and wait for a load already in flight
+        with self.cond:
+            self.wanted = None
+            self.cond.notify_all()
+            while self.busy: self.cond.wait()
+            self.results = []
+
+    def commit(self):
+        self.cancel()
+        self.touched = False
+
+    def revert(self, fallback):
+        # Put back the font that was showing before the first preview
+        self.cancel()
+        if not self.touched: return
+        self.touched = False
+        original, self.original = self.original, None
+        if original is not None:
+            try:
+                self.loader.restore(original)
+                return
+            except OSError:
+                pass # e.g. the VT is in KD_GRAPHICS mode; try the font file instead
+        if fallback != "Default": self.loader.load(fallback)
+
+    def close(self):
+        self.cancel()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.thread is not None: self.thread.join()
+
+    def worker(self):
+        with self.cond:
+            while True:
+                while not self.closed and self.wanted is None: self.cond.wait()
+                if self.closed: return
+                remaining = self.due - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                    continue
+                font_name, self.wanted = self.wanted, None
+                self.busy = True
+                self.cond.release()
+                try:
+                    if not self.touched:
+                        self.original = self.loader.save()
+                        self.touched = True
+                    method = self.loader.load(font_name)
+                except Exception:
+                    method = None
+                finally:
+                    self.cond.acquire()
+                self.busy = False
+                self.results.append((font_name, method))
+                self.cond.notify_all()
+
 def apply_cursor(shape_idx, blink):
     # Linux console cursor escape sequences: \033[?Xc
     # 0: default, 1: block, 2: underline, 3: lower third, 4: lower half, 5: two thirds, 6: full block
@@ -129,9 +735,942 @@ def apply_cursor(shape_idx, blink):
     except Exception:
         pass
 
-class ColorEditor:
+THEME_FORMAT_VERSION = 2
+LOADER_TAG = "TTY_COLOR_EDITOR_LOADER"
+
+def theme_escapes(colors, cursor_shape_idx=None, cursor_blink=None):
+    # Everything the old script produced with echo/setterm/clear, precomputed
+    seq = "".join(palette_escape(i, c) for i, c in enumerate(colors))
+    if cursor_shape_idx is not None:
+        seq += f"\033[?{cursor_shape_idx}c"
+    if cursor_blink is not None:
+        seq += "\033[5m" if cursor_blink else "\033[0m"  # setterm --blink on/off
+    seq += "\033[H\033[J"                             # clear
+    return seq
+
+def compile_theme(colors, font="Default", cursor_shape_idx=None, cursor_blink=None):
+    # A script that is safe both to source and to run with sh: bail out off the Linux VT,
+    # otherwise emit the whole theme with one printf (a shell builtin, no extra processes).
+    body = '[ "$TERM" = linux ] || { return 0 2>/dev/null || exit 0; }\n'
+    if font != "Default":
+        body += f"setfont {font}\n"
+    payload = theme_escapes(colors, cursor_shape_idx, cursor_blink).replace("\033", "\\033")
+    body += f"printf '{payload}'\n"
+    digest = hashlib.sha1(body.encode()).hexdigest()[:12]
+    return f"#!/bin/sh\n# Auto-generated TTY theme (format {THEME_FORMAT_VERSION}, {digest})\n" + body
+
+def write_theme_file(path, script):
+    # Returns False without touching the file when it already holds this exact theme
+    try:
+        with open(path) as f:
+            if f.read() == script: return False
+    except OSError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f: f.write(script)
+    os.chmod(tmp_path, 0o755)
+    os.replace(tmp_path, path)
+    return True
+
+def theme_loader_line(theme_path):
+    # Sourced (no subshell) and skipped entirely in ssh sessions and terminal emulators
+    return f'[ "$TERM" = linux ] && [ -z "$SSH_CONNECTION" ] && [ -f "{theme_path}" ] && . "{theme_path}" # {LOADER_TAG}'
+
+# -- Theme import/export --
+
+ANSI_NAMES = ["black", "red", "green", "yellow", "blue", "magenta", "cyan", "white"]
+# base16-shell's mapping of base00..base0F onto the 16 console slots
+BASE16_SLOTS = ["00", "08", "0B", "0A", "0D", "0E", "0C", "05", "03", "08", "0B", "0A", "0D", "0E", "0C", "07"]
+
+def parse_color_value(value):
+    # "#RRGGBB", "#RGB", "0xRRGGBB", "RRGGBB" or X11 "rgb:R/G/B" -> "RRGGBB" (None if unrecognised)
+    value = value.strip().strip("'\"")
+    m = re.fullmatch(r'rgb:([0-9A-Fa-f]{1,4})/([0-9A-Fa-f]{1,4})/([0-9A-Fa-f]{1,4})', value)
+    if m:
+        return rgb_to_hex(*(int(part, 16) * 255 // (16 ** len(part) - 1) for part in m.groups()))
+    m = re.fullmatch(r'(?:#|0x)?([0-9A-Fa-f]{6})', value)
+    if m: return m.group(1).upper()
+    m = re.fullmatch(r'#([0-9A-Fa-f]{3})', value)
+    if m: return "".join(ch * 2 for ch in m.group(1)).upper()
+    return None
+
+def text_lines(f):
+    for raw in f: yield raw.decode('utf-8', 'replace')
+
+# Importers take a binary file object and a fallback name, and yield (name, { index: "RRGGBB" })
+
+def import_escape(f, name):
+    entries = {}
+    for line in text_lines(f):
+        for idx_char, c in re.findall(r'\]P([0-9A-Fa-f])([0-9A-Fa-f]{6})', line): entries[int(idx_char, 16)] = c.upper()
+    if entries: yield name, entries
+
+def import_hex(f, name):
+    colors = [m.group(1).upper() for m in (re.match(r'\s*#?([0-9A-Fa-f]{6})\s*$', line) for line in text_lines(f)) if m]
+    if colors: yield name, dict(enumerate(colors[:16]))
+
+def import_xresources(f, name):
+    defines, entries = {}, {}
+    for line in text_lines(f):
+        m = re.match(r'\s*#define\s+(\S+)\s+(\S+)', line)
+        if m: defines[m.group(1)] = m.group(2); continue
+        m = re.match(r'\s*[\w.*-]*?color(\d{1,2})\s*:\s*(\S+)', line)
+        if m and int(m.group(1)) < 16:
+            c = parse_color_value(defines.get(m.group(2), m.group(2)))
+            if c: entries[int(m.group(1))] = c
+    if entries: yield name, entries
+
+def import_kitty(f, name):
+    entries = {}
+    for line in text_lines(f):
+        m = re.match(r'\s*color(\d{1,2})\s+(\S+)', line)
+        if m and int(m.group(1)) < 16:
+            c = parse_color_value(m.group(2))
+            if c: entries[int(m.group(1))] = c
+    if entries: yield name, entries
+
+def import_alacritty(f, name):
+    # Handles both alacritty.toml ([colors.normal] black = "#...") and alacritty.yml (normal:\n  black: '0x...')
+    entries, offset, indent = {}, None, -1
+    for line in text_lines(f):
+        m = re.match(r'\s*\[colors\.(normal|bright)\]', line) or re.match(r'(\s*)(normal|bright)\s*:\s*$', line)
+        if m:
+            offset = 0 if m.group(m.lastindex) == "normal" else 8
+            indent = len(m.group(1)) if m.lastindex == 2 else -1
+            continue
+        if re.match(r'\s*\[', line): offset = None; continue
+        # YAML: a sibling or outer key (dim:, cursor:, indexed_colors:) ends the section
+        m = re.match(r'(\s*)[\w-]+\s*:(\s|$)', line)
+        if m and len(m.group(1)) <= indent: offset = None; continue
+        m = re.match(r'\s*(\w+)\s*[=:]\s*(\S+)', line)
+        if offset is not None and m and m.group(1) in ANSI_NAMES:
+            c = parse_color_value(m.group(2))
+            if c: entries[offset + ANSI_NAMES.index(m.group(1))] = c
+    if entries: yield name, entries
+
+def import_base16(f, name):
+    base = {}
+    for line in text_lines(f):
+        m = re.match(r'\s*(scheme|name)\s*:\s*"?([^"#]+)"?', line)
+        if m: name = m.group(2).strip(); continue
+        m = re.match(r'\s*base0([0-9A-Fa-f])\s*:\s*(\S+)', line)
+        if m: base["0" + m.group(1).upper()] = parse_color_value(m.group(2))
+    if all(base.get(slot) for slot in BASE16_SLOTS):
+        yield name, {i: base[slot] for i, slot in enumerate(BASE16_SLOTS)}
+
+def windows_terminal_scheme(scheme):
+    entries = {}
+    for i, ansi in enumerate(ANSI_NAMES):
+        key = "purple" if ansi == "magenta" else ansi
+        for idx, field in ((i, key), (i + 8, "bright" + key.capitalize())):
+            c = parse_color_value(str(scheme.get(field, "")))
+            if c: entries[idx] = c
+    return entries
+
+def import_json(f, name):
+    # Our own {"name", "colors": [...]} export, or Windows Terminal schemes / settings.json
+    data = json.load(f)
+    if isinstance(data, list): data = {"colors": data}
+    if not isinstance(data, dict): return
+    if isinstance(data.get("colors"), list):
+        colors = [parse_color_value(str(c)) for c in data["colors"][:16]]
+        yield data.get("name", name), {i: c for i, c in enumerate(colors) if c}
+        return
+    for scheme in data.get("schemes", [data]):
+        entries = windows_terminal_scheme(scheme)
+        if entries: yield scheme.get("name", name), entries
+
+def import_iterm(f, name):
+    data = plistlib.load(f)
+    entries = {}
+    for i in range(16):
+        color = data.get(f"Ansi {i} Color")
+        if color:
+            entries[i] = rgb_to_hex(*(clamp8(round(float(color.get(f"{ch} Component", 0)) * 255)) for ch in ("Red", "Green", "Blue")))
+    if entries: yield name, entries
+
+THEME_IMPORTERS = {
+    "sh": import_escape, "hex": import_hex, "json": import_json, "xresources": import_xresources,
+    "kitty": import_kitty, "alacritty": import_alacritty, "base16": import_base16, "iterm": import_iterm,
+}
+
+def detect_theme_format(path, head):
+    base = os.path.basename(path).lower()
+    ext = os.path.splitext(base)[1]
+    if ext == ".itermcolors" or b"<plist" in head: return "iterm"
+    if ext == ".json": return "json"
+    if ext in (".yml", ".yaml"): return "base16" if re.search(rb'^\s*base00\s*:', head, re.M) else "alacritty"
+    if ext == ".toml": return "alacritty"
+    if ext == ".hex": return "hex"
+    if ext == ".sh" or b"]P" in head: return "sh"
+    if "xresources" in base or "xdefaults" in base or re.search(rb'color\d{1,2}\s*:', head): return "xresources"
+    if ext == ".conf" or re.search(rb'^\s*color\d{1,2}\s', head, re.M): return "kitty"
+    return "sh"
+
+def read_themes(path):
+    name = os.path.splitext(os.path.basename(path))[0].lstrip('.') or os.path.basename(path)
+    with open(path, 'rb') as f:
+        head = f.read(4096)
+        f.seek(0)
+        return list(THEME_IMPORTERS[detect_theme_format(path, head)](f, name))
+
+# What a missing, unreadable or malformed theme file raises (JSON, TOML and plist errors are ValueErrors)
+THEME_READ_ERRORS = (OSError, ValueError, plistlib.InvalidFileException)
+
+def error_text(e):
+    return e.strerror if isinstance(e, OSError) and e.strerror else str(e)
+
+def read_theme_file(path):
+    themes = read_themes(path)
+    return themes[0][1] if themes else {}
+
+def export_json(colors, name):
+    return json.dumps({"name": name, "colors": list(colors)}, indent=2) + "\n"
+
+def export_hex(colors, name):
+    return "".join(f"#{c}\n" for c in colors)
+
+# format: (file extension, exporter)
+THEME_EXPORTERS = {
+    "sh": (".sh", lambda colors, name: compile_theme(colors)),
+    "json": (".json", export_json),
+    "hex": (".hex", export_hex),
+}
+
+def full_palette(entries, base=DEFAULT_COLORS):
+    colors = list(base)
+    for idx, c in entries.items(): colors[idx] = c
+    return colors
+
+# -- Theme library: a directory of theme files in any importable format, indexed once --
+
+THEME_INDEX_VERSION = 2
+PALETTE_RECORD = 48  # 16 slots x RGB
+THEME_CACHE_SIZE = 256
+
+def theme_library_dir():
+    return os.environ.get("TTY_THEME_LIBRARY") or os.path.join(os.path.expanduser("~"), ".config", "tty_color_editor", "themes")
+
+def pack_palette(colors):
+    return bytes.fromhex("".join(colors))
+
+def unpack_palette(record):
+    h = record.hex().upper()
+    return [h[i:i + 6] for i in range(0, 96, 6)]
+
+class PaletteStore:
+    # Library palettes packed as fixed-size records in one file next to the index.
+    # Rows are read on demand through a small LRU, so listing 20k themes decodes
+    # only the ones on screen; read_all() serves whole-library consumers.
+    def __init__(self, path=None, data=None, cache_size=THEME_CACHE_SIZE):
+        self.path, self.data = path, data
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.file = None
+
+    def record(self, n):
+        if self.data is not None:
+            return self.data[n * PALETTE_RECORD:(n + 1) * PALETTE_RECORD]
+        if self.file is None: self.file = open(self.path, 'rb')
+        self.file.seek(n * PALETTE_RECORD)
+        return self.file.read(PALETTE_RECORD)
+
+    def get(self, n):
+        colors = self.cache.get(n)
+        if colors is not None:
+            self.cache.move_to_end(n)
+            return colors
+        record = self.record(n)
+        if len(record) != PALETTE_RECORD: raise KeyError(n)
+        colors = self.cache[n] = unpack_palette(record)
+        while len(self.cache) > self.cache_size: self.cache.popitem(last=False)
+        return colors
+
+    def read_all(self):
+        if self.data is not None: return bytes(self.data)
+        with open(self.path, 'rb') as f: return f.read()
+
+def load_theme_library(library_dir=None, cache_path=None):
+    # -> ([(name, record, relative path)], PaletteStore); files are only parsed when their
+    # mtime or size changed, and palettes stay on disk until something asks for them
+    library_dir = library_dir or theme_library_dir()
+    cache_path = cache_path or cache_file("themes.json")
+    palette_path = os.path.splitext(cache_path)[0] + ".pal"
+    if not os.path.isdir(library_dir): return [], PaletteStore(data=b"")
+    cached = {}
+    try:
+        with open(cache_path) as f: cache = json.load(f)
+        if (cache.get("version") == THEME_INDEX_VERSION and cache.get("dir") == library_dir
+                and os.path.getsize(palette_path) == cache["records"] * PALETTE_RECORD):
+            cached = cache["files"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    files, fresh, dirty = {}, {}, False
+    for root, dirs, names in os.walk(library_dir):
+        dirs.sort()
+        for filename in sorted(names):
+            path = os.path.join(root, filename)
+            rel = os.path.relpath(path, library_dir)
+            try: st = os.stat(path)
+            except OSError: continue
+            old = cached.get(rel)
+            if old and old.get("mtime") == st.st_mtime_ns and old.get("bytes") == st.st_size:
+                files[rel] = old
+                continue
+            try:
+                fresh[rel] = [(name, pack_palette(full_palette(entries))) for name, entries in read_themes(path)]
+            except Exception:
+                fresh[rel] = []
+            files[rel] = {"mtime": st.st_mtime_ns, "bytes": st.st_size, "themes": []}
+            dirty = True
+
+    if not dirty and len(files) == len(cached):
+        store = PaletteStore(palette_path)
+    else:
+        # Renumber: reused files copy their old records, changed files append new ones
+        old_data = PaletteStore(palette_path).read_all() if cached else b""
+        data = bytearray()
+        for rel, info in files.items():
+            if rel in fresh:
+                themes = fresh[rel]
+            else:
+                themes = [(name, old_data[n * PALETTE_RECORD:(n + 1) * PALETTE_RECORD]) for name, n in info["themes"]]
+            info["themes"] = []
+            for name, record in themes:
+                info["themes"].append([name, len(data) // PALETTE_RECORD])
+                data += record
+        store = PaletteStore(data=data)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            for path, payload in ((palette_path, bytes(data)), (cache_path, None)):
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb' if payload is not None else 'w') as f:
+                    if payload is not None: f.write(payload)
+                    else: json.dump({"version": THEME_INDEX_VERSION, "dir": library_dir,
+                                     "records": len(data) // PALETTE_RECORD, "files": files}, f)
+                os.replace(tmp_path, path)
+        except OSError:
+            pass
+    return [(name, n, rel) for rel, info in files.items() for name, n in info["themes"]], store
+
+class ThemeCatalog(collections.abc.Mapping):
+    # name -> 16 colors over PRESETS plus the theme library. Library palettes come
+    # from the PaletteStore on first access, so building the catalog is just names.
+    def __init__(self, presets, entries=(), store=None):
+        self.presets = presets
+        self.store = store
+        self.records = {}
+        for name, n, rel in entries:
+            key = name if name not in presets and name not in self.records else f"{name} [{rel}]"
+            self.records[key] = n
+        self.names = list(presets) + list(self.records)
+
+    def __getitem__(self, name):
+        if name in self.presets: return self.presets[name]
+        return self.store.get(self.records[name])
+
+    def __contains__(self, name):
+        return name in self.presets or name in self.records
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def values(self):
+        # Bulk path for whole-library consumers (PaletteIndex): one read, LRU untouched
+        data = self.store.read_all() if self.records else b""
+        library = (unpack_palette(data[n * PALETTE_RECORD:(n + 1) * PALETTE_RECORD]) for n in self.records.values())
+        return list(self.presets.values()) + list(library)
+
+    def items(self):
+        return list(zip(self.names, self.values()))
+
+def all_themes(library=None):
+    # PRESETS first, then library themes; clashing names get their file appended
+    entries, store = load_theme_library() if library is None else library
+    return ThemeCatalog(PRESETS, entries, store)
+
+# -- Boot-time palette: kernel parameters, setvtrgb and early-boot hooks --
+
+VT_PARAMS = ("vt.default_red", "vt.default_grn", "vt.default_blu")
+VTRGB_PATH = "/etc/vtrgb"
+GRUB_DEFAULTS = "/etc/default/grub"
+GRUB_CMDLINE_RE = re.compile(r'^(GRUB_CMDLINE_LINUX_DEFAULT|GRUB_CMDLINE_LINUX)=(["\']?)(.*)\2\s*$')
+
+SYSTEMD_UNIT = f"""# Install as /etc/systemd/system/tty-color-editor-vtrgb.service, then:
+#   systemctl enable tty-color-editor-vtrgb.service
+[Unit]
+Description=Console palette (tty_color_editor)
+DefaultDependencies=no
+After=systemd-vconsole-setup.service
+Before=sysinit.target getty-pre.target
+ConditionPathExists={VTRGB_PATH}
+
+[Service]
+Type=oneshot
+RemainAfterExit=yes
+ExecStart=setvtrgb {VTRGB_PATH}
+
+[Install]
+WantedBy=sysinit.target
+"""
+
+INITRAMFS_PREREQS = """PREREQ=""
+prereqs() { echo "$PREREQ"; }
+case "$1" in prereqs) prereqs; exit 0;; esac
+"""
+
+INITRAMFS_HOOK = f"""#!/bin/sh
+# initramfs-tools hook: install as /etc/initramfs-tools/hooks/tty-color-editor, then update-initramfs -u
+{INITRAMFS_PREREQS}. /usr/share/initramfs-tools/hook-functions
+[ -r {VTRGB_PATH} ] || exit 0
+copy_exec "$(command -v setvtrgb)" /bin
+mkdir -p "$DESTDIR/etc"
+cp {VTRGB_PATH} "$DESTDIR{VTRGB_PATH}"
+"""
+
+INITRAMFS_SCRIPT = f"""#!/bin/sh
+# initramfs-tools boot script: install as /etc/initramfs-tools/scripts/init-top/tty-color-editor
+{INITRAMFS_PREREQS}[ -x /bin/setvtrgb ] && [ -r {VTRGB_PATH} ] && /bin/setvtrgb {VTRGB_PATH}
+exit 0
+"""
+
+def vt_params(colors):
+    rgb = [hex_to_rgb(c) for c in colors]
+    return [f"{param}={','.join(str(c[ch]) for c in rgb)}" for ch, param in enumerate(VT_PARAMS)]
+
+def vtrgb_text(colors):
+    # setvtrgb format: one line per channel, 16 comma-separated decimal values
+    rgb = [hex_to_rgb(c) for c in colors]
+    return "".join(",".join(str(c[ch]) for c in rgb) + "\n" for ch in range(3))
+
+def merge_cmdline(cmdline, params):
+    # Replace any vt.default_* arguments, keep everything else in order; anything
+    # after a bare "--" belongs to init, so new params go before it
+    args = cmdline.split()
+    cut = args.index("--") if "--" in args else len(args)
+    kernel = [a for a in args[:cut] if a.split("=", 1)[0] not in VT_PARAMS]
+    return " ".join(kernel + params + args[cut:])
+
+def merge_grub_defaults(text, params):
+    lines = text.splitlines(keepends=True)
+    found = {}
+    for i, line in enumerate(lines):
+        m = GRUB_CMDLINE_RE.match(line)
+        if m: found[m.group(1)] = (i, m)
+    key = "GRUB_CMDLINE_LINUX_DEFAULT" if "GRUB_CMDLINE_LINUX_DEFAULT" in found else "GRUB_CMDLINE_LINUX"
+    # Drop stale params from both variables, add the new ones to one of them
+    for name, (i, m) in found.items():
+        value = merge_cmdline(m.group(3), params if name == key else [])
+        lines[i] = f'{name}="{value}"\n'
+    if not found:
+        if lines and not lines[-1].endswith("\n"): lines[-1] += "\n"
+        lines.append(f'GRUB_CMDLINE_LINUX_DEFAULT="{" ".join(params)}"\n')
+    return "".join(lines)
+
+def boot_files(colors):
+    # Output file name -> (content, mode)
+    params = " ".join(vt_params(colors))
+    return {
+        "cmdline.txt": (params + "\n", 0o644),
+        "vtrgb": (vtrgb_text(colors), 0o644),
+        "tty-color-editor-vtrgb.service": (SYSTEMD_UNIT, 0o644),
+        "initramfs-tools/hooks/tty-color-editor": (INITRAMFS_HOOK, 0o755),
+        "initramfs-tools/scripts/init-top/tty-color-editor": (INITRAMFS_SCRIPT, 0o755),
+    }
+
+def config_diff(path, update):
+    # Unified diff of what update() would do to the file at path; None if it cannot be read
+    try:
+        with open(path) as f: before = f.read()
+    except OSError:
+        return None
+    after = update(before)
+    return "".join(difflib.unified_diff(before.splitlines(keepends=True), after.splitlines(keepends=True), path, path + " (proposed)"))
+
+# -- Undo/redo --
+
+HISTORY_SIZE = 512
+HISTORY_MERGE_GAP = 1.0  # seconds; slider steps closer than this collapse into one undo entry
+# base palette (16x3 bytes), the six Adjustments, font name id, cursor shape, cursor blink, selected slot
+SNAPSHOT = struct.Struct("<48s6dHB?B")
+
+class History:
+    # Fixed-size snapshots in a preallocated ring buffer; undo/redo just move a cursor
+    def __init__(self, capacity=HISTORY_SIZE):
+        self.capacity = capacity
+        self.buf = bytearray(capacity * SNAPSHOT.size)
+        self.start = 0      # ring slot of the oldest snapshot
+        self.count = 0      # snapshots stored
+        self.pos = -1       # logical index of the current state
+        self.last_kind = None
+        self.last_time = 0.0
+
+    def slot(self, i):
+        offset = (self.start + i) % self.capacity * SNAPSHOT.size
+        return slice(offset, offset + SNAPSHOT.size)
+
+    def current(self):
+        return bytes(self.buf[self.slot(self.pos)]) if self.pos >= 0 else None
+
+    def push(self, snap, kind=None):
+        now = time.monotonic()
+        if snap == self.current(): return
+        if kind is not None and kind == self.last_kind and now - self.last_time < HISTORY_MERGE_GAP:
+            self.buf[self.slot(self.pos)] = snap
+        else:
+            self.count = self.pos + 1  # a new edit drops the redo branch
+            if self.count == self.capacity:
+                self.start = (self.start + 1) % self.capacity
+                self.count -= 1
+            self.buf[self.slot(self.count)] = snap
+            self.count += 1
+            self.pos = self.count - 1
+        self.last_kind, self.last_time = kind, now
+
+    def undo(self):
+        if self.pos <= 0: return None
+        self.pos -= 1
+        self.last_kind = None
+        return self.current()
+
+    def redo(self):
+        if self.pos >= self.count - 1: return None
+        self.pos += 1
+        self.last_kind = None
+        return self.current()
+
+# -- Perceptual palette search (OKLab, per-slot delta E) --
+
+def srgb_to_linear(v):
+    v /= 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+SRGB_LINEAR = [srgb_to_linear(v) for v in range(256)]
+
+@functools.lru_cache(maxsize=8192)
+def hex_to_oklab(hex_color):
+    n = int(hex_color, 16)
+    r, g, b = SRGB_LINEAR[n >> 16], SRGB_LINEAR[(n >> 8) & 0xFF], SRGB_LINEAR[n & 0xFF]
+    l = (0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b) ** (1 / 3)
+    m = (0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b) ** (1 / 3)
+    s = (0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b) ** (1 / 3)
+    return (0.2104542553 * l + 0.7936177850 * m - 0.0040720468 * s,
+            1.9779984951 * l - 2.4285922050 * m + 0.4505937099 * s,
+            0.0259040371 * l + 0.7827717662 * m - 0.8086757660 * s)
+
+def linear_to_srgb(v):
+    v = v * 12.92 if v <= 0.0031308 else 1.055 * v ** (1 / 2.4) - 0.055
+    return max(0, min(255, round(v * 255)))
+
+def oklab_to_hex(lab):
+    L, a, b = lab
+    l = (L + 0.3963377774 * a + 0.2158037573 * b) ** 3
+    m = (L - 0.1055613458 * a - 0.0638541728 * b) ** 3
+    s = (L - 0.0894841775 * a - 1.2914855480 * b) ** 3
+    return rgb_to_hex(linear_to_srgb(4.0767416621 * l - 3.3077115913 * m + 0.2309699292 * s),
+                      linear_to_srgb(-1.2684380046 * l + 2.6097574011 * m - 0.3413193965 * s),
+                      linear_to_srgb(-0.0041960863 * l - 0.7034186147 * m + 1.7076147010 * s))
+
+def delta_e(hex_a, hex_b):
+    return math.dist(hex_to_oklab(hex_a), hex_to_oklab(hex_b))
+
+def palette_features(colors):
+    return [v for c in colors for v in hex_to_oklab(c)]
+
+# -- Legibility: WCAG 2 contrast ratio and APCA lightness contrast (Lc) --
+
+# Default flags pairs that are poor even for large/bold text; body text wants 4.5:1 and Lc 60+.
+# The APCA floor is opt-in (--min-lc, 30 for large text); each metric is checked on its own.
+WCAG_MIN_RATIO = 3.0
+APCA_MIN_LC = None
+# USAGE_HINTS slots as text on Background. Slot 8 (bright black, "Comments") is dim on purpose
+# and often doubles as a surface colour, so it is left out.
+LEGIBILITY_PAIRS = [(fg, 0) for fg in range(1, 16) if fg != 8]
+APCA_LINEAR = [(v / 255) ** 2.4 for v in range(256)]
+
+def relative_luminance(hex_color):
+    n = int(hex_color, 16)
+    return 0.2126 * SRGB_LINEAR[n >> 16] + 0.7152 * SRGB_LINEAR[(n >> 8) & 0xFF] + 0.0722 * SRGB_LINEAR[n & 0xFF]
+
+def apca_luminance(hex_color):
+    n = int(hex_color, 16)
+    y = 0.2126729 * APCA_LINEAR[n >> 16] + 0.7151522 * APCA_LINEAR[(n >> 8) & 0xFF] + 0.0721750 * APCA_LINEAR[n & 0xFF]
+    return y + (0.022 - y) ** 1.414 if y < 0.022 else y # soft clamp near black
+
+def wcag_ratio(lum_a, lum_b):
+    return (max(lum_a, lum_b) + 0.05) / (min(lum_a, lum_b) + 0.05)
+
+def apca_lc(text_y, bg_y):
+    # APCA 0.0.98G: positive for dark text on light, negative for light text on dark
+    if abs(bg_y - text_y) < 0.0005: return 0.0
+    if bg_y > text_y:
+        sapc = (bg_y ** 0.56 - text_y ** 0.57) * 1.14
+        return 0.0 if sapc < 0.1 else (sapc - 0.027) * 100
+    sapc = (bg_y ** 0.65 - text_y ** 0.62) * 1.14
+    return 0.0 if sapc > -0.1 else (sapc + 0.027) * 100
+
+def wcag_grade(ratio):
+    return "AAA" if ratio >= 7 else "AA" if ratio >= 4.5 else "AA large" if ratio >= 3 else "fail"
+
+class ContrastMatrix:
+    # ratio[fg][bg] and lc[fg][bg] for all 16x16 slot pairs (fg = text). update() caches
+    # luminance per changed slot and marks its row and column; flush() recomputes just
+    # those cells, so a slider step costs 31 cells and any number of brightness steps
+    # between two reads cost one pass.
+    def __init__(self, colors=None):
+        self.colors = [None] * 16
+        self.lum = [0.0] * 16
+        self.apca_y = [0.0] * 16
+        self.ratio = [[1.0] * 16 for _ in range(16)]
+        self.lc = [[0.0] * 16 for _ in range(16)]
+        self.dirty = set()
+        if colors is not None: self.update(colors)
+
+    def update(self, colors):
+        for i in range(16):
+            if colors[i] == self.colors[i]: continue
+            self.colors[i] = colors[i]
+            self.lum[i] = relative_luminance(colors[i])
+            self.apca_y[i] = apca_luminance(colors[i])
+            self.dirty.add(i)
+
+    def flush(self):
+        dirty, self.dirty = self.dirty, set()
+        for fg in range(16):
+            for bg in (range(16) if fg in dirty else dirty):
+                self.ratio[fg][bg] = wcag_ratio(self.lum[fg], self.lum[bg])
+                self.lc[fg][bg] = apca_lc(self.apca_y[fg], self.apca_y[bg])
+        return dirty
+
+    def poor(self, fg, bg, min_ratio=WCAG_MIN_RATIO, min_lc=APCA_MIN_LC):
+        # A threshold of None skips that metric
+        if min_ratio is not None and self.ratio[fg][bg] < min_ratio: return True
+        return min_lc is not None and abs(self.lc[fg][bg]) < min_lc
+
+    def failures(self, pairs=LEGIBILITY_PAIRS, min_ratio=WCAG_MIN_RATIO, min_lc=APCA_MIN_LC):
+        if self.dirty: self.flush()
+        return [(fg, bg, self.ratio[fg][bg], self.lc[fg][bg]) for fg, bg in pairs if self.poor(fg, bg, min_ratio, min_lc)]
+
+@functools.lru_cache(maxsize=1024)
+def swatch_runs(theme, palette):
+    # [(start, length, slot)]: theme colors mapped to the nearest palette slot, merged into runs
+    runs = []
+    for i, c in enumerate(theme):
+        slot = closest_color(c, palette)[0]
+        if runs and runs[-1][2] == slot: runs[-1] = (runs[-1][0], runs[-1][1] + 1, slot)
+        else: runs.append((i, 1, slot))
+    return runs
+
+def closest_color(hex_color, colors):
+    # (slot, delta E) of the entry in colors nearest to hex_color
+    return min(((i, delta_e(hex_color, c)) for i, c in enumerate(colors)), key=lambda item: item[1])
+
+class PaletteIndex:
+    # Every palette converted to OKLab once (N x 48 feature matrix). Distance between two
+    # palettes is the RMS of the 16 per-slot delta E values.
+    def __init__(self, themes):
+        self.names = list(themes)
+        rows = [palette_features(colors) for colors in themes.values()]
+        if np is not None:
+            self.features = np.array(rows, dtype=np.float64).reshape(len(rows), 48)
+        else:
+            self.features = [array.array('d', row) for row in rows]
+
+    def query(self, colors, k=8, exclude=()):
+        q = palette_features(colors)
+        want = k + len(exclude)
+        if np is not None:
+            dist = np.sqrt(((self.features - np.array(q)) ** 2).sum(axis=1) / 16)
+            order = np.argsort(dist)[:want]
+            ranked = [(self.names[i], float(dist[i])) for i in order]
+        else:
+            # Brute force with early abandon once a palette is already worse than the current k-th best
+            heap = []
+            for i, row in enumerate(self.features):
+                bound = -heap[0][0] if len(heap) == want else float("inf")
+                acc = 0.0
+                for a, b in zip(row, q):
+                    acc += (a - b) * (a - b)
+                    if acc > bound: break
+                else:
+                    if len(heap) == want: heapq.heapreplace(heap, (-acc, -i))
+                    else: heapq.heappush(heap, (-acc, -i))
+            ranked = [(self.names[-i], math.sqrt(-acc / 16)) for acc, i in sorted(heap, reverse=True)]
+        return [(name, d) for name, d in ranked if name not in exclude][:k]
+
+# -- Profiling: opt-in timing wrappers, nothing is instrumented unless enabled --
+
+PROFILE_ENV = "TTY_EDITOR_PROFILE"
+PROFILE_FILE = "tty_color_editor_profile.json"
+PROFILE_MAX_EVENTS = 100000
+PROFILE_BUCKETS = 24  # log2 microsecond buckets: <1us .. ~8s
+
+class Histogram:
+    __slots__ = ("count", "total", "low", "high", "buckets")
+
+    def __init__(self):
+        self.count, self.total = 0, 0.0
+        self.low, self.high = math.inf, 0.0
+        self.buckets = [0] * PROFILE_BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds < self.low: self.low = seconds
+        if seconds > self.high: self.high = seconds
+        self.buckets[min(PROFILE_BUCKETS - 1, int(seconds * 1e6).bit_length())] += 1
+
+    def percentile(self, p):
+        # Upper edge of the bucket holding the p-th sample, capped by the observed max
+        want = max(1, math.ceil(self.count * p / 100))
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= want: return min(self.high, (1 << i) / 1e6)
+        return self.high
+
+    def summary(self):
+        return {"count": self.count, "total_ms": self.total * 1e3,
+                "mean_ms": self.total / self.count * 1e3 if self.count else 0.0,
+                "min_ms": self.low * 1e3 if self.count else 0.0, "max_ms": self.high * 1e3,
+                "p50_ms": self.percentile(50) * 1e3, "p95_ms": self.percentile(95) * 1e3,
+                "buckets_us": {str(1 << i): n for i, n in enumerate(self.buckets) if n}}
+
+class CountingStream:
+    # Stand-in for sys.stdout that tallies what the editor writes outside curses
+    def __init__(self, stream, counters):
+        self.stream, self.counters = stream, counters
+
+    def write(self, s):
+        self.counters["stdout_bytes"] += len(s.encode("utf-8", "replace"))
+        self.counters["stdout_writes"] += 1
+        return self.stream.write(s)
+
+    def flush(self):
+        self.counters["stdout_flushes"] += 1
+        return self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class Profiler:
+    def __init__(self, path=PROFILE_FILE, max_events=PROFILE_MAX_EVENTS):
+        self.path = path
+        self.counters = collections.Counter()
+        self.stats = collections.defaultdict(Histogram)
+        self.events = collections.deque(maxlen=max_events)
+        self.origin = time.perf_counter()
+        self.overlay = False
+        self.input_at = None
+        self.patched = []
+
+    def record(self, name, start, end):
+        self.stats[name].add(end - start)
+        self.events.append((name, start, end))
+
+    def wrap(self, owner, attr, name=None, before=None, after=None, record=True):
+        # record=False only runs the hooks (for calls that mostly wait, like getch)
+        original = getattr(owner, attr)
+        name = name or attr
+        perf_counter = time.perf_counter
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            if before: before(args)
+            start = perf_counter()
+            try:
+                result = original(*args, **kwargs)
+            finally:
+                end = perf_counter()
+                if record: self.record(name, start, end)
+            if after: after(end, result)
+            return result
+
+        self.patched.append((owner, attr, original))
+        setattr(owner, attr, timed)
+
+    def install(self, module):
+        # Swap module-level functions and methods for timed wrappers. Callers look
+        # them up at call time, so no call site changes and no cost when disabled.
+        self.wrap(module.ColorEditor, "draw_ui", after=self.painted)
+        self.wrap(module.ColorEditor, "read_keys", after=self.received, record=False)
+        self.wrap(module.ColorEditor, "refresh_colors")
+        self.wrap(module.Palette, "transformed", "palette.transform")
+        self.wrap(module.Crossfade, "frame", "fade.frame")
+        self.wrap(module.ContrastMatrix, "flush", "contrast.flush")
+        self.wrap(module.PaletteWriter, "flush", "palette.flush")
+        self.wrap(module, "apply_color")
+        self.wrap(module, "scale_color")
+        self.wrap(module, "load_font_index")
+        self.wrap(module, "get_fonts")
+        self.wrap(module, "apply_font")
+        self.wrap(module, "apply_cursor")
+        self.wrap(module.FontLoader, "decode", "font.decode")
+        self.wrap(module.LinuxConsole, "set_font", "font.ioctl")
+        self.wrap(module.FontLoader, "save", "font.save")
+        self.wrap(subprocess, "run", "subprocess", before=self.spawned)
+        self.patched.append((sys, "stdout", sys.stdout))
+        sys.stdout = CountingStream(sys.stdout, self.counters)
+
+    def uninstall(self):
+        for owner, attr, original in reversed(self.patched):
+            setattr(owner, attr, original)
+        self.patched = []
+
+    def spawned(self, args):
+        argv = args[0] if args else None
+        self.counters[f"spawn:{argv[0] if isinstance(argv, (list, tuple)) else argv}"] += 1
+
+    def received(self, end, keys):
+        if keys and self.input_at is None: self.input_at = end
+
+    def painted(self, end, result):
+        self.counters["frames"] += 1
+        if self.input_at is not None:
+            self.record("input_to_paint", self.input_at, end)
+            self.input_at = None
+
+    def overlay_lines(self):
+        lines = [f"PROFILE  frames {self.counters['frames']}  stdout {self.counters['stdout_bytes']} B"]
+        ranked = sorted(self.stats.items(), key=lambda kv: kv[1].total, reverse=True)
+        for name, h in ranked:
+            lines.append(f"{name[:16]:<16} {h.count:>6} p50 {h.percentile(50)*1e3:7.2f} p95 {h.percentile(95)*1e3:7.2f} ms")
+        return lines
+
+    def report(self):
+        pid = os.getpid()
+        trace = [{"name": name, "ph": "X", "pid": pid, "tid": 0,
+                  "ts": (start - self.origin) * 1e6, "dur": (end - start) * 1e6}
+                 for name, start, end in self.events]
+        return {"traceEvents": trace, "displayTimeUnit": "ms",
+                "otherData": {"counters": dict(self.counters),
+                              "histograms": {name: h.summary() for name, h in sorted(self.stats.items())},
+                              "dropped_events": max(0, sum(h.count for h in self.stats.values()) - len(self.events))}}
+
+    def dump(self, path=None):
+        path = path or self.path
+        with open(path, "w") as f: json.dump(self.report(), f)
+        return path
+
+PROFILER = None
+
+# -- Crossfades between palettes, stepped on a fixed frame grid --
+
+FADE_ENV = "TTY_EDITOR_FADE"
+FADE_DURATION = 0.4  # seconds; 0 switches palettes instantly
+FADE_FPS = 30
+
+class Crossfade:
+    # Interpolates every slot in OKLab from `start` to `target`. Frames land on a
+    # began + k/fps grid; a late wake-up jumps straight to the current slot, so
+    # a slow terminal drops frames instead of falling behind.
+    def __init__(self, start, target, duration, now, fps=FADE_FPS):
+        self.start = [hex_to_oklab(c) for c in start]
+        self.target = list(target)
+        self.end = [hex_to_oklab(c) for c in self.target]
+        self.duration = duration
+        self.interval = 1 / fps
+        self.began = now
+        self.tick = -1
+        self.dropped = 0
+        self.shown = list(start)
+
+    def frame(self, now):
+        # -> (colors to show, finished)
+        tick = int((now - self.began) / self.interval)
+        if tick == self.tick: return self.shown, False
+        if self.tick >= 0: self.dropped += max(0, tick - self.tick - 1)
+        self.tick = tick
+        t = min(1.0, tick * self.interval / self.duration)
+        if t >= 1.0:
+            self.shown = self.target
+            return self.shown, True
+        e = t * t * (3 - 2 * t) # smoothstep
+        self.shown = [end if a == b else oklab_to_hex(tuple(x + (y - x) * e for x, y in zip(a, b)))
+                      for a, b, end in zip(self.start, self.end, self.target)]
+        return self.shown, False
+
+    def next_frame(self, now):
+        return self.began + (int((now - self.began) / self.interval) + 1) * self.interval
+
+    def retarget(self, target, now):
+        # Carry on from whatever is on screen now towards the new palette
+        return Crossfade(self.shown, target, self.duration, now, 1 / self.interval)
+
+class Region:
+    def __init__(self, y, x, width):
+        self.y, self.x, self.width = y, x, width
+        self.win = curses.newwin(1, width, y, x)
+        self.content = None
+
+    def overlaps(self, other):
+        return self.y == other.y and self.x < other.x + other.width and other.x < self.x + self.width
+
+class Renderer:
+    # Retained-mode screen: every piece of text on screen is a named one-line
+    # region backed by its own window. Only regions whose (text, attr) changed
+    # since the last frame are rewritten; curses.doupdate() then emits the diff.
     def __init__(self, stdscr):
         self.stdscr = stdscr
+        self.regions = {}
+        self.frame = {}
+        self.size = None
+
+    def begin(self):
+        size = self.stdscr.getmaxyx()
+        if size != self.size:
+            # First frame or terminal resized: drop everything and repaint once
+            self.size = size
+            self.regions = {}
+            self.stdscr.clear()
+            self.stdscr.noutrefresh()
+        self.frame = {}
+        return size
+
+    def text(self, name, y, x, text, attr=curses.A_NORMAL):
+        height, width = self.size
+        if y < 0 or y >= height or x < 0 or x >= width: return
+        text = text[:width - x]
+        if text: self.frame[name] = (y, x, text, attr)
+
+    def end(self):
+        dirty = []
+        # Blank out regions that vanished or moved; whatever sat under them is re-copied below
+        for name, region in list(self.regions.items()):
+            spec = self.frame.get(name)
+            if spec is None or (spec[0], spec[1], len(spec[2])) != (region.y, region.x, region.width):
+                region.win.erase()
+                region.win.noutrefresh()
+                dirty.append(region)
+                del self.regions[name]
+
+        # Paint in z-order (the order regions were drawn this frame)
+        for name, (y, x, text, attr) in self.frame.items():
+            region = self.regions.get(name)
+            if region is None:
+                region = self.regions[name] = Region(y, x, len(text))
+            if region.content != (text, attr):
+                region.content = (text, attr)
+                region.win.erase()
+                try: region.win.addstr(0, 0, text, attr)
+                except curses.error: pass # writing the last cell of a window moves the cursor out of it
+            elif any(region.overlaps(d) for d in dirty):
+                region.win.touchwin()
+            else:
+                continue
+            region.win.noutrefresh()
+            dirty.append(region)
+        curses.doupdate()
+
+class ColorEditor:
+    def __init__(self, stdscr, fade_duration=FADE_DURATION):
+        self.stdscr = stdscr
+        self.screen = Renderer(stdscr)
+        self.palette = PaletteWriter()
         curses.curs_set(0)
         curses.start_color()
         if curses.has_colors():
@@ -140,30 +1679,52 @@ class ColorEditor:
                  try: curses.init_pair(i, i-1, -1)
                  except: pass
 
-        self.base_colors = list(DEFAULT_COLORS)
-        self.colors = list(DEFAULT_COLORS)
-        self.brightness = 1.0
+        self.base_colors = Palette.from_hex(DEFAULT_COLORS)
+        self.adjust = Adjustments()
+        self.colors = self.base_colors.transformed(self.adjust)
+        self.fade_duration = fade_duration
+        self.fade = None
+        self.contrast = ContrastMatrix(self.colors)
+        self.contrast_fg, self.contrast_bg = 7, 0
+        self.adjust_idx = 0
         self.current_selection = 0
         
-        # State: 'LIST', 'EDIT', 'PRESETS', 'INSTALL', 'FONTS', 'CURSOR'
+        # State: 'LIST', 'EDIT', 'PRESETS', 'INSTALL', 'FONTS', 'CURSOR', 'ADJUST', 'NEAREST'
         self.state = 'LIST'
         
         # Edit vars
         self.edit_rgb = [0, 0, 0]
         self.edit_channel_idx = 0
+
+        # Held-key tracking for step acceleration
+        self.accelerate = True
+        self.held_axis = None
+        self.held_at = 0.0
+        self.held_count = 0
         
         # Preset vars
-        self.preset_list = list(PRESETS.keys())
-        self.preset_idx = 0
+        self.themes = all_themes()
+        self.preset_list = list(self.themes.keys())
+        self.preset_idx = 0     # position in the filtered view
+        self.preset_top = 0     # first visible row of the gallery
+        self.preset_keys = None # lowercased names, built on the first search
+        self.preset_search = False
+        self.preset_filters = [("", range(len(self.preset_list)))] # (query, matching indices), one per keystroke
+
+        # Nearest-theme search
+        self.palette_index = None
+        self.nearest = []
+        self.nearest_idx = 0
 
         # Font vars
-        self.font_data = get_fonts()
-        self.families = sorted(list(self.font_data.keys()))
-        self.font_family_idx = 0
-        self.font_size_idx = 0
+        self.font_index = load_font_index()
+        self.charsets = sorted({e["charset"] for e in self.font_index})
         self.font_bold = False
-        self.font_edit_field = 0 # 0: Family, 1: Size, 2: Bold
+        self.font_edit_field = 0 # 0: Charset, 1: Family, 2: Size, 3: Bold
+        self.select_charset(self.charsets.index("Lat15") if "Lat15" in self.charsets else 0)
         self.current_font = "Default"
+        self.default_font = None # console font before the first change, for undoing back to "Default"
+        self.previewer = FontPreviewer(FONT_LOADER)
 
         # Cursor vars
         self.cursor_shapes = ["Default", "Block", "Underline", "Lower Third", "Lower Half", "Two Thirds", "Full Block"]
@@ -173,73 +1734,191 @@ class ColorEditor:
         
         self.message = "ARROWS:Move | ENTER:Edit | S:Save | P:Presets | F:Fonts | C:Cursor | I:Install | Q:Quit"
 
+        # Undo/redo; font names are interned so snapshots stay fixed-size
+        self.font_names = ["Default"]
+        self.history = History()
+        self.record()
+
+        self.profiler = PROFILER
+
     def run(self):
-        while True:
-            self.draw_ui()
-            key = self.stdscr.getch()
-            
-            if self.state == 'LIST':
-                if key in [ord('q'), ord('Q')]: break
-                elif key == curses.KEY_UP: self.current_selection = (self.current_selection - 1) % 16
-                elif key == curses.KEY_DOWN: self.current_selection = (self.current_selection + 1) % 16
-                elif key in [ord('\n'), curses.KEY_ENTER]: self.enter_edit_mode()
-                elif key in [ord('s'), ord('S')]: self.save_theme_dialog()
-                elif key in [ord('p'), ord('P')]: self.state = 'PRESETS'; self.message = "Select Preset (ENTER to apply, ESC to cancel)"
-                elif key in [ord('f'), ord('F')]: self.state = 'FONTS'; self.message = "Select Font (ENTER to apply, ESC to cancel)"
-                elif key in [ord('c'), ord('C')]: self.state = 'CURSOR'; self.message = "UD: Option | LR: Toggle | ESC: Back"
-                elif key in [ord('i'), ord('I')]: self.state = 'INSTALL'; self.message = "I: Install to .bashrc | U: Uninstall | ESC: Cancel"
-                elif key == ord('['): self.adjust_brightness(-0.05)
-                elif key == ord(']'): self.adjust_brightness(0.05)
-            
-            elif self.state == 'EDIT':
-                if key == 27: self.state = 'LIST'; self.reset_msg()
-                elif key in [ord('\n'), curses.KEY_ENTER]: self.state = 'LIST'; self.reset_msg()
-                elif key == curses.KEY_UP: self.edit_channel_idx = (self.edit_channel_idx - 1) % 3
-                elif key == curses.KEY_DOWN: self.edit_channel_idx = (self.edit_channel_idx + 1) % 3
-                elif key == curses.KEY_LEFT: self.adjust_color(-1)
-                elif key == curses.KEY_RIGHT: self.adjust_color(1)
-            
-            elif self.state == 'PRESETS':
-                if key == 27: self.state = 'LIST'; self.reset_msg()
-                elif key == curses.KEY_UP: self.preset_idx = (self.preset_idx - 1) % len(self.preset_list)
-                elif key == curses.KEY_DOWN: self.preset_idx = (self.preset_idx + 1) % len(self.preset_list)
-                elif key in [ord('\n'), curses.KEY_ENTER]: self.apply_preset(self.preset_list[self.preset_idx]); self.state = 'LIST'; self.reset_msg()
-
-            elif self.state == 'FONTS':
-                if key == 27: self.state = 'LIST'; self.reset_msg()
-                elif key == curses.KEY_UP: self.font_edit_field = (self.font_edit_field - 1) % 3
-                elif key == curses.KEY_DOWN: self.font_edit_field = (self.font_edit_field + 1) % 3
-                elif key in [curses.KEY_LEFT, curses.KEY_RIGHT]:
-                    delta = 1 if key == curses.KEY_RIGHT else -1
-                    if self.font_edit_field == 0:
-                        self.font_family_idx = (self.font_family_idx + delta) % len(self.families)
-                        self.font_size_idx = 0 # Reset size when family changes
-                    elif self.font_edit_field == 1:
-                        family = self.families[self.font_family_idx]
-                        sizes = sorted(list(self.font_data[family].keys()))
-                        self.font_size_idx = (self.font_size_idx + delta) % len(sizes)
-                    elif self.font_edit_field == 2:
-                        self.font_bold = not self.font_bold
-                elif key in [ord('\n'), curses.KEY_ENTER]:
-                    self.apply_structured_font()
-                    self.state = 'LIST'; self.reset_msg()
-
-            elif self.state == 'CURSOR':
-                if key == 27: self.state = 'LIST'; self.reset_msg()
-                elif key == curses.KEY_UP: self.cursor_edit_idx = (self.cursor_edit_idx - 1) % 2
-                elif key == curses.KEY_DOWN: self.cursor_edit_idx = (self.cursor_edit_idx + 1) % 2
-                elif key in [curses.KEY_LEFT, curses.KEY_RIGHT]:
-                    if self.cursor_edit_idx == 0:
-                        delta = 1 if key == curses.KEY_RIGHT else -1
-                        self.cursor_shape_idx = (self.cursor_shape_idx + delta) % len(self.cursor_shapes)
-                    else:
-                        self.cursor_blink = not self.cursor_blink
-                    apply_cursor(self.cursor_shape_idx, self.cursor_blink)
-
-            elif self.state == 'INSTALL':
-                if key == 27: self.state = 'LIST'; self.reset_msg()
-                elif key in [ord('i'), ord('I')]: self.install_permanent()
-                elif key in [ord('u'), ord('U')]: self.uninstall_permanent()
+        try:
+            while True:
+                self.step_fade()
+                self.palette.flush()
+                self.draw_ui()
+                for key, delta in coalesce_keys(self.read_keys()):
+                    if not self.handle_key(key, delta): return
+                self.poll_preview()
+        finally:
+            # Land any running fade on its target, and send what keys earlier in the
+            # batch that ended with quit left queued on the writer
+            self.finish_fade()
+            self.palette.flush()
+            self.previewer.close()
+
+    def read_keys(self):
+        # Block for the first key, then drain whatever else is already queued (autorepeat).
+        # While a fade or font preview is running, wake up in time for its next frame.
+        wait = self.wait_ms()
+        if wait is not None: self.stdscr.timeout(wait)
+        keys = [self.stdscr.getch()]
+        if keys[0] == -1:
+            self.stdscr.nodelay(False)
+            return []
+        self.stdscr.nodelay(True)
+        try:
+            while len(keys) < MAX_KEY_BATCH:
+                key = self.stdscr.getch()
+                if key == -1: break
+                keys.append(key)
+        finally:
+            self.stdscr.nodelay(False)
+
+        # Only autorepeat counts as held: a key drained right behind an identical one. Separate
+        # taps arrive one per read, however quick, and reset the count. A run that opens a read
+        # carries the count over if the previous read ended in the same run.
+        now = time.monotonic()
+        axes = [KEY_AXES.get(key, (None, 0))[0] for key in keys]
+        for i, axis in enumerate(axes):
+            if axis is None: self.held_count = 0
+            elif i > 0 and axes[i - 1] == axis: self.held_count += 1
+            elif i + 1 < len(axes) and axes[i + 1] == axis and axis == self.held_axis and now - self.held_at < HOLD_GAP: pass
+            else: self.held_count = 0
+            self.held_axis = axis
+        self.held_at = now
+        return keys
+
+    def wait_ms(self):
+        waits = []
+        if self.fade: waits.append(max(1, math.ceil((self.fade.next_frame(time.monotonic()) - time.monotonic()) * 1000)))
+        if self.previewer.pending(): waits.append(FONT_PREVIEW_POLL_MS)
+        return min(waits, default=None)
+
+    def step_fade(self):
+        if not self.fade: return
+        colors, done = self.fade.frame(time.monotonic())
+        self.palette.set_all(colors)
+        if done: self.fade = None
+
+    def finish_fade(self):
+        if self.fade:
+            self.palette.set_all(self.fade.target)
+            self.fade = None
+
+    def fade_to(self, colors, previous):
+        # Start a crossfade from what the terminal shows now, or bend a running one
+        now = time.monotonic()
+        if self.fade: self.fade = self.fade.retarget(colors, now)
+        elif self.fade_duration > 0: self.fade = Crossfade(self.palette.sent_colors(previous), colors, self.fade_duration, now)
+        else: self.palette.set_all(colors)
+
+    def hold_step(self):
+        if not self.accelerate: return 1
+        return min(MAX_HOLD_STEP, 1 + self.held_count // HOLD_ACCEL_EVERY)
+
+    def handle_key(self, key, delta=1):
+        # key is a raw key code, or an axis name from KEY_AXES with a signed net delta
+        if key == ord('`') and self.profiler:
+            self.profiler.overlay = not self.profiler.overlay
+            return True
+        if self.state == 'LIST':
+            if key in [ord('q'), ord('Q')]: return False
+            elif key == 'UD': self.current_selection = (self.current_selection + delta) % 16
+            elif key in [ord('\n'), curses.KEY_ENTER]: self.enter_edit_mode()
+            elif key in [ord('s'), ord('S')]: self.save_theme_dialog()
+            elif key in [ord('p'), ord('P')]: self.state = 'PRESETS'; self.message = "Select Preset (ENTER to apply, /: Search, ESC to cancel)"
+            elif key in [ord('f'), ord('F')]: self.open_fonts()
+            elif key in [ord('c'), ord('C')]: self.state = 'CURSOR'; self.message = "UD: Option | LR: Toggle | ESC: Back"
+            elif key in [ord('i'), ord('I')]: self.state = 'INSTALL'; self.message = "I: Install to .bashrc | U: Uninstall | ESC: Cancel"
+            elif key in [ord('a'), ord('A')]: self.state = 'ADJUST'; self.message = "UD: Transform | LR: Adjust | 0: Reset | ESC: Back"
+            elif key == 'BRIGHT': self.adjust_brightness(0.05 * delta)
+            elif key in [ord('r'), ord('R')]: self.palette.resync(self.colors); self.message = "Palette resynced"
+            elif key in [ord('n'), ord('N')]: self.find_nearest(list(self.colors))
+            elif key in [ord('v'), ord('V')]: self.apply_to_consoles()
+            elif key in [ord('m'), ord('M')]: self.state = 'CONTRAST'; self.contrast_msg()
+            elif key in [ord('u'), ord('U')]: self.restore(self.history.undo(), "Undo")
+            elif key == 18: self.restore(self.history.redo(), "Redo") # Ctrl-R
+        
+        elif self.state == 'EDIT':
+            if key == 27: self.state = 'LIST'; self.reset_msg()
+            elif key in [ord('\n'), curses.KEY_ENTER]: self.state = 'LIST'; self.reset_msg()
+            elif key == 'UD': self.edit_channel_idx = (self.edit_channel_idx + delta) % 3
+            elif key == 'LR': self.adjust_color(delta * self.hold_step())
+        
+        elif self.state == 'PRESETS':
+            view = self.preset_filters[-1][1]
+            if key == 27: self.close_presets()
+            elif key == 'UD' and view: self.preset_idx = (self.preset_idx + delta) % len(view)
+            elif key in [ord('\n'), curses.KEY_ENTER]:
+                if view: self.apply_preset(self.selected_preset())
+                self.close_presets()
+            elif self.preset_search:
+                if key in [curses.KEY_BACKSPACE, 127, 8]: self.filter_presets(None)
+                elif isinstance(key, int) and 32 <= key < 127: self.filter_presets(chr(key))
+            elif key == ord('/'): self.preset_search = True; self.message = "Type to filter | BACKSPACE: Delete | ENTER: Apply | ESC: Cancel"
+            elif key in [ord('n'), ord('N')] and view:
+                name = self.selected_preset()
+                self.find_nearest(self.themes[name], exclude=(name,))
+
+        elif self.state == 'NEAREST':
+            if key == 27: self.state = 'LIST'; self.reset_msg()
+            elif key == 'UD' and self.nearest: self.nearest_idx = (self.nearest_idx + delta) % len(self.nearest)
+            elif key in [ord('\n'), curses.KEY_ENTER] and self.nearest:
+                self.apply_preset(self.nearest[self.nearest_idx][0]); self.state = 'LIST'
+
+        elif self.state == 'FONTS':
+            if key == 27: self.previewer.revert(self.font_on_open); self.state = 'LIST'; self.reset_msg()
+            elif key == 'UD': self.font_edit_field = (self.font_edit_field + delta) % 4
+            elif key == 'LR' and self.families:
+                if self.font_edit_field == 0:
+                    self.select_charset((self.font_charset_idx + delta) % len(self.charsets))
+                elif self.font_edit_field == 1:
+                    self.font_family_idx = (self.font_family_idx + delta) % len(self.families)
+                    self.font_size_idx = 0 # Reset size when family changes
+                elif self.font_edit_field == 2:
+                    sizes = self.font_sizes(self.families[self.font_family_idx])
+                    self.font_size_idx = (self.font_size_idx + delta) % len(sizes)
+                elif self.font_edit_field == 3 and delta % 2:
+                    self.font_bold = not self.font_bold
+                filename = self.selected_font_file()
+                if filename: self.previewer.request(filename)
+            elif key in [ord('\n'), curses.KEY_ENTER]:
+                self.previewer.commit()
+                self.apply_structured_font()
+                self.state = 'LIST'; self.reset_msg()
+
+        elif self.state == 'CURSOR':
+            if key == 27: self.state = 'LIST'; self.reset_msg()
+            elif key == 'UD': self.cursor_edit_idx = (self.cursor_edit_idx + delta) % 2
+            elif key == 'LR':
+                if self.cursor_edit_idx == 0:
+                    self.cursor_shape_idx = (self.cursor_shape_idx + delta) % len(self.cursor_shapes)
+                elif delta % 2:
+                    self.cursor_blink = not self.cursor_blink
+                apply_cursor(self.cursor_shape_idx, self.cursor_blink)
+                self.record(('cursor', self.cursor_edit_idx))
+
+        elif self.state == 'CONTRAST':
+            if key in [27, ord('\n'), curses.KEY_ENTER]: self.state = 'LIST'; self.reset_msg(); return True
+            elif key == 'UD': self.contrast_fg = (self.contrast_fg + delta) % 16
+            elif key == 'LR': self.contrast_bg = (self.contrast_bg + delta) % 16
+            self.contrast_msg()
+
+        elif self.state == 'ADJUST':
+            if key in [27, ord('\n'), curses.KEY_ENTER]: self.state = 'LIST'; self.reset_msg()
+            elif key == 'UD': self.adjust_idx = (self.adjust_idx + delta) % len(ADJUST_PARAMS)
+            elif key == 'LR': self.adjust_param(delta)
+            elif key == ord('0'):
+                self.adjust = Adjustments(brightness=self.brightness)
+                self.refresh_colors()
+                self.record()
+
+        elif self.state == 'INSTALL':
+            if key == 27: self.state = 'LIST'; self.reset_msg()
+            elif key in [ord('i'), ord('I')]: self.install_permanent()
+            elif key in [ord('u'), ord('U')]: self.uninstall_permanent()
+        return True
 
     def reset_msg(self):
         self.message = "ARROWS:Move | ENTER:Edit | S:Save | P:Presets | F:Fonts | C:Cursor | [ ]:Bright | Q:Quit"
@@ -247,63 +1926,242 @@ class ColorEditor:
     def enter_edit_mode(self):
         self.state = 'EDIT'
         self.message = "UD: Channel | LR: Adjust | ENTER: Done"
-        r, g, b = hex_to_rgb(self.base_colors[self.current_selection])
+        r, g, b = self.base_colors.rgb(self.current_selection)
         self.edit_rgb = [r, g, b]
         self.edit_channel_idx = 0
 
+    @property
+    def brightness(self):
+        return self.adjust.brightness
+
+    @brightness.setter
+    def brightness(self, value):
+        self.adjust.brightness = value
+
+    def refresh_colors(self, fade=False):
+        # Re-run the adjustment pipeline over all 16 entries; the writer only sends what changed.
+        # Edits made while a fade runs retarget it rather than jumping.
+        previous, self.colors = self.colors, self.base_colors.transformed(self.adjust)
+        self.contrast.update(self.colors)
+        if fade or self.fade: self.fade_to(list(self.colors), list(previous))
+        else: self.palette.set_all(self.colors)
+
+    def snapshot(self):
+        if self.current_font not in self.font_names: self.font_names.append(self.current_font)
+        return SNAPSHOT.pack(self.base_colors.tobytes(), *self.adjust.key(), self.font_names.index(self.current_font),
+                             self.cursor_shape_idx, self.cursor_blink, self.current_selection)
+
+    def record(self, kind=None):
+        # kind groups consecutive steps of one slider into a single undo entry
+        self.history.push(self.snapshot(), kind)
+
+    def restore(self, snap, label):
+        if snap is None:
+            self.message = f"Nothing to {label.lower()}"
+            return
+        data, *rest = SNAPSHOT.unpack(snap)
+        adjust, (font_id, shape_idx, blink, selection) = rest[:6], rest[6:]
+        self.base_colors = Palette(data)
+        self.adjust = Adjustments(*adjust)
+        self.current_selection = selection
+        self.refresh_colors() # the palette writer only resends entries that differ
+        if (shape_idx, blink) != (self.cursor_shape_idx, self.cursor_blink):
+            self.cursor_shape_idx, self.cursor_blink = shape_idx, blink
+            apply_cursor(shape_idx, blink)
+        self.message = label
+        font = self.font_names[font_id]
+        if font != self.current_font:
+            if self.restore_font(font): self.current_font = font
+            else: self.message = f"{label} (could not restore font: {font})"
+
+    def restore_font(self, font):
+        # "Default" is whatever the console showed before the first font change
+        if font != "Default": return bool(apply_font(font))
+        if self.default_font is None: return False
+        try:
+            FONT_LOADER.restore(self.default_font)
+            return True
+        except OSError:
+            return False
+
     def adjust_color(self, delta):
         self.edit_rgb[self.edit_channel_idx] = max(0, min(255, self.edit_rgb[self.edit_channel_idx] + delta))
-        new_hex = rgb_to_hex(*self.edit_rgb)
-        self.base_colors[self.current_selection] = new_hex
-        self.colors[self.current_selection] = scale_color(new_hex, self.brightness)
-        apply_color(self.current_selection, self.colors[self.current_selection])
+        self.base_colors.set_rgb(self.current_selection, *self.edit_rgb)
+        self.refresh_colors()
+        self.record(('color', self.current_selection, self.edit_channel_idx))
         
     def adjust_brightness(self, delta):
         self.brightness = max(0.1, min(2.0, self.brightness + delta))
-        for i in range(16):
-            self.colors[i] = scale_color(self.base_colors[i], self.brightness)
-            apply_color(i, self.colors[i])
+        self.refresh_colors()
+        self.record('brightness')
+
+    def adjust_param(self, delta):
+        label, field, step, lo, hi = ADJUST_PARAMS[self.adjust_idx]
+        setattr(self.adjust, field, max(lo, min(hi, getattr(self.adjust, field) + step * delta)))
+        self.refresh_colors()
+        self.record(('adjust', field))
 
     def apply_preset(self, name):
-        if name in PRESETS:
-            self.base_colors = list(PRESETS[name])
-            for i in range(16):
-                self.colors[i] = scale_color(self.base_colors[i], self.brightness)
-                apply_color(i, self.colors[i])
+        if name in self.themes:
+            self.base_colors = Palette.from_hex(self.themes[name])
+            self.refresh_colors(fade=True)
+            self.record()
             self.message = f"Applied preset: {name}"
 
-    def apply_structured_font(self):
-        if not self.families: return
+    def apply_to_consoles(self):
+        # Every other VT; this one already has the palette
+        try: own = os.ttyname(sys.stdout.fileno())
+        except (OSError, ValueError): own = None
+        targets = [t for t in console_ttys() if t != own]
+        self.message = broadcast_summary(broadcast_palette(dict(enumerate(self.colors)), targets))
+
+    def contrast_msg(self):
+        self.contrast.flush()
+        fg, bg = self.contrast_fg, self.contrast_bg
+        ratio, lc = self.contrast.ratio[fg][bg], self.contrast.lc[fg][bg]
+        self.message = f"{USAGE_HINTS[fg]} on {USAGE_HINTS[bg]}: {ratio:.2f}:1 {wcag_grade(ratio)} | APCA Lc {lc:.0f} | ESC: Back"
+
+    def selected_preset(self):
+        return self.preset_list[self.preset_filters[-1][1][self.preset_idx]]
+
+    def filter_presets(self, char):
+        # Each keystroke narrows the previous result set; backspace (None) pops back to it
+        if char is None:
+            if len(self.preset_filters) > 1: self.preset_filters.pop()
+        else:
+            if self.preset_keys is None: self.preset_keys = [name.lower() for name in self.preset_list]
+            query, matches = self.preset_filters[-1]
+            query += char.lower()
+            self.preset_filters.append((query, [i for i in matches if query in self.preset_keys[i]]))
+        self.preset_idx = self.preset_top = 0
+
+    def close_presets(self):
+        if len(self.preset_filters) > 1:
+            # Keep the highlight on the same theme once the filter is gone
+            self.preset_idx = self.preset_filters[-1][1][self.preset_idx] if self.preset_filters[-1][1] else 0
+            del self.preset_filters[1:]
+        self.preset_search = False
+        self.state = 'LIST'
+        self.reset_msg()
+
+    def select_charset(self, idx):
+        self.font_charset_idx = idx
+        charset = self.charsets[idx] if self.charsets else None
+        self.font_data = get_fonts(self.font_index, charset)
+        self.families = sorted(self.font_data)
+        self.font_family_idx = 0
+        self.font_size_idx = 0
+
+    def font_sizes(self, family):
+        return list(self.font_data[family])
+
+    def find_nearest(self, colors, exclude=()):
+        if self.palette_index is None: self.palette_index = PaletteIndex(self.themes)
+        self.nearest = self.palette_index.query(colors, k=10, exclude=exclude)
+        self.nearest_idx = 0
+        self.state = 'NEAREST'
+        self.message = "Closest themes (dE = RMS OKLab difference x100) | ENTER: Apply | ESC: Back"
+
+    def selected_font_file(self):
+        if not self.families: return None
         family = self.families[self.font_family_idx]
-        sizes = sorted(list(self.font_data[family].keys()))
-        size = sizes[self.font_size_idx]
+        size = self.font_sizes(family)[self.font_size_idx]
         
         # Determine best filename
         options = self.font_data[family][size]
-        filename = None
+        entry = None
         if self.font_bold and 'bold' in options:
-            filename = options['bold']
+            entry = options['bold']
         elif 'normal' in options:
-            filename = options['normal']
+            entry = options['normal']
         elif 'bold' in options:
-            filename = options['bold']
-            
-        if filename:
+            entry = options['bold']
+        return entry["file"] if entry else None
+
+    def poll_preview(self):
+        for filename, method in self.previewer.poll():
+            if self.state != 'FONTS': continue
+            if method: self.message = f"Previewing {filename} (ENTER: keep, ESC: revert)"
+            else: self.message = f"Could not load font: {filename}"
+
+    def open_fonts(self):
+        self.state = 'FONTS'
+        self.message = "Select Font (ENTER to apply, ESC to cancel)"
+        self.font_on_open = self.current_font
+        if self.current_font == "Default" and self.default_font is None: self.default_font = FONT_LOADER.save()
+
+    def apply_structured_font(self):
+        filename = self.selected_font_file()
+        if not filename: return
+        if apply_font(filename):
             self.current_font = filename
-            apply_font(filename)
+            self.record()
             self.message = f"Applied font: {filename}"
+        else:
+            self.message = f"Could not load font: {filename}"
+
+    def draw_gallery(self, height, width, y, x):
+        # Only the rows that fit are drawn (regions are named by row, not by theme,
+        # so scrolling rewrites text in place); palettes load as rows come into view
+        query, view = self.preset_filters[-1]
+        rows = max(1, height - 2 - (y + 2))
+        if self.preset_idx < self.preset_top: self.preset_top = self.preset_idx
+        elif self.preset_idx >= self.preset_top + rows: self.preset_top = self.preset_idx - rows + 1
+        title = "SELECT PRESET" + (f"  /{query}" if self.preset_search or query else "")
+        self.screen.text("panel_title", y, x, title[:24], curses.A_UNDERLINE)
+        self.screen.text("panel_count", y, x + 26, f"{self.preset_idx + 1 if view else 0}/{len(view)}", curses.A_DIM)
+        show_strip = curses.has_colors() and width >= x + 26 + 16
+        palette = tuple(self.colors)
+        for row, pos in enumerate(range(self.preset_top, min(len(view), self.preset_top + rows))):
+            name = self.preset_list[view[pos]]
+            selected = pos == self.preset_idx
+            prefix = "> " if selected else "  "
+            self.screen.text(f"panel_{row}", y + 2 + row, x, f"{prefix}{name[:22]:<22}", curses.A_REVERSE if selected else curses.A_NORMAL)
+            if not show_strip: continue
+            # The console can only show its 16 current colors, so each theme color
+            # is drawn as the nearest slot of the live palette
+            for start, length, slot in swatch_runs(tuple(self.themes[name]), palette):
+                self.screen.text(f"strip_{row}_{start}", y + 2 + row, x + 26 + start, "█" * length, self.slot_attr(slot))
+
+    def draw_contrast(self, width, y, x):
+        # Rows are text slots, columns background slots, cells the WCAG ratio. Weak pairs are
+        # reversed; weak pairs that USAGE_HINTS relies on are also bold.
+        x = max(0, min(x, width - 3 - 16 * 3))
+        weak = len(self.contrast.failures()) # flushes pending rows/columns
+        self.screen.text("panel_title", y, x, f"CONTRAST  {weak} weak hint pair{'s' if weak != 1 else ''}", curses.A_UNDERLINE)
+        self.screen.text("panel_header", y + 1, x, "  " + "".join(f"{bg:>3X}" for bg in range(16)), curses.A_DIM)
+        hints = set(LEGIBILITY_PAIRS)
+        for fg in range(16):
+            cells = []
+            for bg in range(16):
+                attr = curses.A_NORMAL
+                if fg != bg and self.contrast.poor(fg, bg):
+                    attr = curses.A_REVERSE | (curses.A_BOLD if (fg, bg) in hints else 0)
+                if (fg, bg) == (self.contrast_fg, self.contrast_bg): attr |= curses.A_UNDERLINE
+                text = f"{min(99, int(self.contrast.ratio[fg][bg])):>3}"
+                if cells and cells[-1][2] == attr: cells[-1][1] += text
+                else: cells.append([bg, text, attr])
+            self.screen.text(f"panel_row_{fg}", y + 2 + fg, x, f"{fg:X} ", curses.A_DIM)
+            for bg, text, attr in cells:
+                self.screen.text(f"cell_{fg}_{bg}", y + 2 + fg, x + 2 + bg * 3, text, attr)
+
+    def slot_attr(self, slot):
+        # 16-colour terminals get a pair per slot. On 8-colour ones (TERM=linux) pairs 9-16
+        # do not exist, so bright slots are the base pair plus bold, and 0-7 must not be bold.
+        if getattr(curses, "COLORS", 8) >= 16: return curses.color_pair(slot + 1)
+        return curses.color_pair(slot % 8 + 1) | (curses.A_BOLD if slot >= 8 else 0)
 
     def draw_bar(self, y, x, value, label, is_selected):
         filled_len = int((value / 255.0) * 20)
         bar_str = "█" * filled_len + "░" * (20 - filled_len)
         prefix = "> " if is_selected else "  "
         attr = curses.A_BOLD if is_selected else curses.A_NORMAL
-        self.stdscr.addstr(y, x, f"{prefix}{label} [{bar_str}] {value:3}", attr)
+        self.screen.text(f"bar_{label}", y, x, f"{prefix}{label} [{bar_str}] {value:3}", attr)
 
     def draw_ui(self):
-        self.stdscr.clear()
-        height, width = self.stdscr.getmaxyx()
-        self.stdscr.addstr(1, (width - 25) // 2, f"TTY Color Editor (B:{self.brightness:.2f})", curses.A_BOLD)
+        ui = self.screen
+        height, width = ui.begin()
+        ui.text("title", 1, (width - 25) // 2, f"TTY Color Editor (B:{self.brightness:.2f})", curses.A_BOLD)
 
         # -- LEFT PANEL (List) --
         start_y = 3
@@ -313,99 +2171,123 @@ class ColorEditor:
             is_active_edit = (i == self.current_selection) and (self.state == 'EDIT')
             prefix = " >" if is_cursor else (" *" if is_active_edit else "  ")
             color_hex = self.colors[i]
-            base_hex = self.base_colors[i]
             attr = curses.A_REVERSE if (is_cursor or is_active_edit) else curses.A_NORMAL
             
             # Add label hint
             hint = f"({USAGE_HINTS[i]})"
-            self.stdscr.addstr(start_y + i, 2, f"{prefix} {i:<2} {COLOR_NAMES[i][:10]:<10} #{color_hex} {hint}", attr)
+            ui.text(f"row_{i}", start_y + i, 2, f"{prefix} {i:<2} {COLOR_NAMES[i][:10]:<10} #{color_hex} {hint}", attr)
             
             if curses.has_colors():
-                 try: self.stdscr.addstr(start_y + i, 50, "█", curses.color_pair(i+1) | curses.A_BOLD)
-                 except: pass
+                 ui.text(f"swatch_{i}", start_y + i, 50, "█", curses.color_pair(i+1) | curses.A_BOLD)
 
         # -- RIGHT PANEL (Context Dependent) --
         detail_x = 35
         detail_y = 5
         
         if self.state == 'EDIT':
-            self.stdscr.addstr(detail_y, detail_x, f"EDIT COLOR {self.current_selection}", curses.A_UNDERLINE)
-            try:
-                for r in range(3): self.stdscr.addstr(detail_y + 2 + r, detail_x, "██████████", curses.color_pair(self.current_selection+1))
-            except: pass
+            ui.text("panel_title", detail_y, detail_x, f"EDIT COLOR {self.current_selection}", curses.A_UNDERLINE)
+            for r in range(3): ui.text(f"panel_swatch_{r}", detail_y + 2 + r, detail_x, "██████████", curses.color_pair(self.current_selection+1))
             
             self.draw_bar(detail_y+6, detail_x, self.edit_rgb[0], "R", self.edit_channel_idx==0)
             self.draw_bar(detail_y+7, detail_x, self.edit_rgb[1], "G", self.edit_channel_idx==1)
             self.draw_bar(detail_y+8, detail_x, self.edit_rgb[2], "B", self.edit_channel_idx==2)
 
         elif self.state == 'PRESETS':
-            self.stdscr.addstr(detail_y, detail_x, "SELECT PRESET", curses.A_UNDERLINE)
-            for idx, name in enumerate(self.preset_list):
-                 prefix = "> " if idx == self.preset_idx else "  "
-                 attr = curses.A_REVERSE if idx == self.preset_idx else curses.A_NORMAL
-                 self.stdscr.addstr(detail_y + 2 + idx, detail_x, f"{prefix}{name}", attr)
+            self.draw_gallery(height, width, detail_y, detail_x)
+
+        elif self.state == 'CONTRAST':
+            self.draw_contrast(width, detail_y, detail_x)
+
+        elif self.state == 'NEAREST':
+            ui.text("panel_title", detail_y, detail_x, "CLOSEST THEMES", curses.A_UNDERLINE)
+            for idx, (name, dist) in enumerate(self.nearest):
+                prefix = "> " if idx == self.nearest_idx else "  "
+                attr = curses.A_REVERSE if idx == self.nearest_idx else curses.A_NORMAL
+                ui.text(f"panel_{idx}", detail_y + 2 + idx, detail_x, f"{prefix}{name[:24]:<24} dE {dist * 100:5.1f}", attr)
+            if self.nearest:
+                target = self.themes[self.nearest[self.nearest_idx][0]]
+                slot, dist = closest_color(self.colors[self.current_selection], target)
+                ui.text("panel_slot", detail_y + 3 + len(self.nearest), detail_x,
+                        f"Color {self.current_selection} ~ #{target[slot]} (slot {slot}, dE {dist * 100:.1f})", curses.A_DIM)
 
         elif self.state == 'FONTS':
-            self.stdscr.addstr(detail_y, detail_x, "FONT SETTINGS (Latin)", curses.A_UNDERLINE)
+            ui.text("panel_title", detail_y, detail_x, "FONT SETTINGS", curses.A_UNDERLINE)
             if not self.families:
-                self.stdscr.addstr(detail_y + 2, detail_x, "No Latin fonts found.")
+                ui.text("panel_0", detail_y + 2, detail_x, "No console fonts found.")
             else:
                 family = self.families[self.font_family_idx]
-                sizes = sorted(list(self.font_data[family].keys()))
-                size = sizes[self.font_size_idx]
-                
-                # Family
+                size = self.font_sizes(family)[self.font_size_idx]
+                variants = self.font_data[family][size]
+
+                # Charset
                 prefix = "> " if self.font_edit_field == 0 else "  "
                 attr = curses.A_BOLD if self.font_edit_field == 0 else curses.A_NORMAL
-                self.stdscr.addstr(detail_y + 2, detail_x, f"{prefix}Type: < {family} >", attr)
+                ui.text("panel_0", detail_y + 2, detail_x, f"{prefix}Charset: < {self.charsets[self.font_charset_idx]} >", attr)
                 
-                # Size
+                # Family
                 prefix = "> " if self.font_edit_field == 1 else "  "
                 attr = curses.A_BOLD if self.font_edit_field == 1 else curses.A_NORMAL
-                self.stdscr.addstr(detail_y + 4, detail_x, f"{prefix}Size: < {size} >", attr)
+                ui.text("panel_1", detail_y + 4, detail_x, f"{prefix}Type: < {family} >", attr)
                 
-                # Bold
+                # Size
                 prefix = "> " if self.font_edit_field == 2 else "  "
                 attr = curses.A_BOLD if self.font_edit_field == 2 else curses.A_NORMAL
-                has_bold = 'bold' in self.font_data[family][size]
+                ui.text("panel_2", detail_y + 6, detail_x, f"{prefix}Size: < {size} >", attr)
+                entry = variants.get('normal') or variants.get('bold')
+                unicode = ", unicode" if entry["unicode"] else ""
+                ui.text("panel_3", detail_y + 7, detail_x, f"  {entry['glyphs']} glyphs{unicode}", curses.A_DIM)
+                
+                # Bold
+                prefix = "> " if self.font_edit_field == 3 else "  "
+                attr = curses.A_BOLD if self.font_edit_field == 3 else curses.A_NORMAL
+                has_bold = 'bold' in variants
                 bold_status = ("ON" if self.font_bold else "OFF") if has_bold else "N/A"
-                self.stdscr.addstr(detail_y + 6, detail_x, f"{prefix}Bold: < {bold_status} >", attr)
+                ui.text("panel_4", detail_y + 9, detail_x, f"{prefix}Bold: < {bold_status} >", attr)
 
         elif self.state == 'CURSOR':
-            self.stdscr.addstr(detail_y, detail_x, "CURSOR SETTINGS", curses.A_UNDERLINE)
+            ui.text("panel_title", detail_y, detail_x, "CURSOR SETTINGS", curses.A_UNDERLINE)
             
             # Shape
             prefix = "> " if self.cursor_edit_idx == 0 else "  "
             attr = curses.A_BOLD if self.cursor_edit_idx == 0 else curses.A_NORMAL
-            self.stdscr.addstr(detail_y + 2, detail_x, f"{prefix}Shape: < {self.cursor_shapes[self.cursor_shape_idx]} >", attr)
+            ui.text("panel_0", detail_y + 2, detail_x, f"{prefix}Shape: < {self.cursor_shapes[self.cursor_shape_idx]} >", attr)
             
             # Blink
             prefix = "> " if self.cursor_edit_idx == 1 else "  "
             attr = curses.A_BOLD if self.cursor_edit_idx == 1 else curses.A_NORMAL
             blink_status = "ON" if self.cursor_blink else "OFF"
-            self.stdscr.addstr(detail_y + 4, detail_x, f"{prefix}Blink: < {blink_status} >", attr)
+            ui.text("panel_1", detail_y + 4, detail_x, f"{prefix}Blink: < {blink_status} >", attr)
+
+        elif self.state == 'ADJUST':
+            ui.text("panel_title", detail_y, detail_x, "ADJUST PALETTE", curses.A_UNDERLINE)
+            for idx, (label, field, step, lo, hi) in enumerate(ADJUST_PARAMS):
+                prefix = "> " if idx == self.adjust_idx else "  "
+                attr = curses.A_BOLD if idx == self.adjust_idx else curses.A_NORMAL
+                ui.text(f"panel_{idx}", detail_y + 2 + idx, detail_x, f"{prefix}{label:<11} < {getattr(self.adjust, field):6.2f} >", attr)
 
         elif self.state == 'INSTALL':
-             self.stdscr.addstr(detail_y, detail_x, "PERMANENT INSTALL", curses.A_UNDERLINE)
-             self.stdscr.addstr(detail_y+2, detail_x, "This will modify ~/.bashrc")
-             self.stdscr.addstr(detail_y+3, detail_x, "Press 'I' to Install")
-             self.stdscr.addstr(detail_y+4, detail_x, "Press 'U' to Uninstall")
-             self.stdscr.addstr(detail_y+6, detail_x, "Includes Colors, Font, Cursor", curses.A_DIM)
+             ui.text("panel_title", detail_y, detail_x, "PERMANENT INSTALL", curses.A_UNDERLINE)
+             ui.text("panel_0", detail_y+2, detail_x, "This will modify ~/.bashrc")
+             ui.text("panel_1", detail_y+3, detail_x, "Press 'I' to Install")
+             ui.text("panel_2", detail_y+4, detail_x, "Press 'U' to Uninstall")
+             ui.text("panel_3", detail_y+6, detail_x, "Includes Colors, Font, Cursor", curses.A_DIM)
+
+        ui.text("status", height-2, 2, self.message[:width-4])
+        if self.profiler and self.profiler.overlay: self.draw_profile(height, width)
+        ui.end()
 
-        self.stdscr.addstr(height-2, 2, self.message[:width-4])
-        self.stdscr.refresh()
+    def draw_profile(self, height, width):
+        lines = self.profiler.overlay_lines()[:max(0, height - 4)]
+        x = max(0, width - 62)
+        for n, line in enumerate(lines):
+            self.screen.text(f"profile_{n}", 1 + n, x, line.ljust(60), curses.A_REVERSE)
+
+    def theme_script(self):
+        return compile_theme(self.colors, self.current_font, self.cursor_shape_idx, self.cursor_blink)
 
     def save_theme_dialog(self):
         try:
-            with open("my_theme.sh", 'w') as f:
-                f.write("#!/bin/sh\n")
-                for i, c in enumerate(self.colors): f.write(f'echo -en "\\033]P{i:X}{c}"\n')
-                if self.current_font != "Default":
-                    f.write(f"setfont {self.current_font}\n")
-                f.write(f'echo -en "\\033[?{self.cursor_shape_idx}c"\n')
-                blink_cmd = "on" if self.cursor_blink else "off"
-                f.write(f"setterm --blink {blink_cmd}\n")
-                f.write('clear\n')
+            write_theme_file("my_theme.sh", self.theme_script())
             self.message = f"Saved to my_theme.sh"
         except Exception as e: self.message = f"Error: {e}"
 
@@ -414,33 +2296,29 @@ class ColorEditor:
         theme_path = os.path.join(home, ".tty_theme_current.sh")
         bashrc_path = os.path.join(home, ".bashrc")
         
-        # 1. Save current theme to hidden file
+        # 1. Save current theme to hidden file (untouched if the compiled theme is identical)
         try:
-            with open(theme_path, 'w') as f:
-                f.write("#!/bin/sh\n# Auto-generated TTY theme\n")
-                for i, c in enumerate(self.colors): f.write(f'echo -en "\\033]P{i:X}{c}"\n')
-                if self.current_font != "Default":
-                    f.write(f"setfont {self.current_font}\n")
-                f.write(f'echo -en "\\033[?{self.cursor_shape_idx}c"\n')
-                blink_cmd = "on" if self.cursor_blink else "off"
-                f.write(f"setterm --blink {blink_cmd}\n")
-                f.write('clear\n') # clear needed to refresh
+            theme_changed = write_theme_file(theme_path, self.theme_script())
             
-            # 2. Add to bashrc if not present
-            loader_line = f'[ -f "{theme_path}" ] && sh "{theme_path}" # TTY_COLOR_EDITOR_LOADER'
+            # 2. Add (or upgrade) the loader in bashrc
+            loader_line = theme_loader_line(theme_path)
             
-            already_in = False
+            lines = []
             if os.path.exists(bashrc_path):
-                with open(bashrc_path, 'r') as f:
-                    if "TTY_COLOR_EDITOR_LOADER" in f.read():
-                        already_in = True
+                with open(bashrc_path, 'r') as f: lines = f.readlines()
+            old_loaders = [line.rstrip("\n") for line in lines if LOADER_TAG in line]
             
-            if not already_in:
+            if old_loaders == [loader_line]:
+                self.message = "Updated theme file (loader was already in bashrc)." if theme_changed else "Theme unchanged, nothing to do."
+            elif old_loaders:
+                with open(bashrc_path, 'w') as f:
+                    f.writelines(line if LOADER_TAG not in line else "" for line in lines)
+                    f.write(f"{loader_line}\n")
+                self.message = "Updated theme file and upgraded the bashrc loader."
+            else:
                 with open(bashrc_path, 'a') as f:
                     f.write(f"\n{loader_line}\n")
                 self.message = "Installed! Theme will load on login."
-            else:
-                self.message = "Updated theme file (loader was already in bashrc)."
                 
         except Exception as e:
             self.message = f"Install failed: {e}"
@@ -453,34 +2331,260 @@ class ColorEditor:
                 with open(bashrc_path, 'r') as f: lines = f.readlines()
                 with open(bashrc_path, 'w') as f:
                     for line in lines:
-                        if "TTY_COLOR_EDITOR_LOADER" not in line:
+                        if LOADER_TAG not in line:
                             f.write(line)
             self.message = "Uninstalled from .bashrc"
         except Exception as e: self.message = f"Uninstall failed: {e}"
 
     def load_theme_from_file(self, filename):
         try:
-            with open(filename, 'r') as f: content = f.read()
-            matches = re.findall(r'\]P([0-9A-Fa-f])([0-9A-Fa-f]{6})', content)
-            if matches:
-                for idx_char, c in matches:
-                    idx = int(idx_char, 16)
-                    self.base_colors[idx] = c.upper()
-                    self.colors[idx] = c.upper()
-                    apply_color(idx, c.upper())
-                self.message = f"Loaded {len(matches)} colors. Brightness reset to 1.0."
+            entries = read_theme_file(filename)
+            if entries:
+                for idx, c in entries.items(): self.base_colors[idx] = c
                 self.brightness = 1.0
+                self.refresh_colors(fade=True)
+                self.record()
+                self.message = f"Loaded {len(entries)} colors. Brightness reset to 1.0."
         except Exception as e: self.message = f"Error: {e}"
 
+# -- Headless CLI: no curses, no font scan --
+
+def find_preset(themes, name):
+    for preset in themes:
+        if preset.lower() == name.lower(): return preset
+    raise SystemExit(f"Unknown preset: {name} (see the 'presets' command)")
+
+def cli_entries(args):
+    if args.preset:
+        themes = all_themes()
+        return dict(enumerate(themes[find_preset(themes, args.preset)]))
+    try:
+        entries = read_theme_file(args.theme)
+    except THEME_READ_ERRORS as e:
+        raise SystemExit(f"{args.theme}: {error_text(e)}")
+    if not entries: raise SystemExit(f"No colors found in {args.theme}")
+    return entries
+
+def cli_apply(args):
+    entries = cli_entries(args)
+    if args.tty or args.all_vts:
+        targets = list(args.tty or []) + (console_ttys() if args.all_vts else [])
+        results = broadcast_palette({idx: scale_color(c, args.brightness) for idx, c in entries.items()},
+                                    list(dict.fromkeys(targets)), args.timeout)
+        for path, error in results.items():
+            if error: print(f"{path}: {error}", file=sys.stderr)
+        return 1 if any(results.values()) else 0
+    writer = PaletteWriter(sys.stdout)
+    for idx, c in entries.items(): writer.set(idx, scale_color(c, args.brightness))
+    writer.flush()
+    return 0
+
+def cli_export(args):
+    themes = all_themes()
+    preset = find_preset(themes, args.preset)
+    text = THEME_EXPORTERS[args.format][1](themes[preset], preset)
+    if args.output:
+        with open(args.output, 'w') as f: f.write(text)
+    else:
+        sys.stdout.write(text)
+    return 0
+
+def convert_theme_file(job):
+    src, dest_dir, fmt = job
+    try:
+        themes = read_themes(src)
+        if not themes: return src, "no colors found"
+        # Keep the source extension: a.toml and a.yml must not both become a.json
+        stem = os.path.basename(src)
+        ext, exporter = THEME_EXPORTERS[fmt]
+        for name, entries in themes:
+            # Files holding several schemes (Windows Terminal settings) get one output per scheme
+            out_name = stem if len(themes) == 1 else f"{stem}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}"
+            with open(os.path.join(dest_dir, out_name + ext), 'w') as f:
+                f.write(exporter(full_palette(entries), name))
+        return src, None
+    except Exception as e:
+        return src, str(e)
+
+def job_count(text):
+    n = int(text)
+    if n < 0: raise argparse.ArgumentTypeError(f"must be 0 or more, not {n}")
+    return n
+
+def cli_convert(args):
+    try:
+        sources = [entry.path for entry in os.scandir(args.source) if entry.is_file()]
+        os.makedirs(args.dest, exist_ok=True)
+    except OSError as e:
+        raise SystemExit(f"{e.filename}: {error_text(e)}")
+    jobs = ((src, args.dest, args.format) for src in sources)
+    done = failed = 0
+    if args.jobs == 1:
+        results = map(convert_theme_file, jobs)
+    else:
+        pool = multiprocessing.Pool(args.jobs or None)
+        results = pool.imap_unordered(convert_theme_file, jobs, chunksize=32)
+    try:
+        for src, error in results:
+            if error:
+                failed += 1
+                print(f"{src}: {error}", file=sys.stderr)
+            else:
+                done += 1
+    finally:
+        if args.jobs != 1: pool.close(); pool.join()
+    print(f"Converted {done} theme(s), {failed} failed.")
+    return 1 if failed else 0
+
+def cli_boot(args):
+    colors = [scale_color(c, args.brightness) for c in full_palette(cli_entries(args))]
+    params = vt_params(colors)
+    print(" ".join(params))
+
+    # Dry run: show what the running kernel and the bootloader config would change into
+    for path, update in ((args.cmdline, lambda text: merge_cmdline(text, params) + "\n"),
+                         (args.grub, lambda text: merge_grub_defaults(text, params))):
+        diff = config_diff(path, update)
+        if diff is None: print(f"# {path}: not readable, skipped", file=sys.stderr)
+        elif not diff: print(f"# {path}: already up to date", file=sys.stderr)
+        else: sys.stdout.write(diff)
+
+    if args.output:
+        for name, (text, mode) in boot_files(colors).items():
+            path = os.path.join(args.output, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f: f.write(text)
+            os.chmod(path, mode)
+            print(f"# wrote {path}", file=sys.stderr)
+        print(f"# next: cp {shlex.quote(os.path.join(args.output, 'vtrgb'))} {VTRGB_PATH}, then install the unit or initramfs hook (see their headers)", file=sys.stderr)
+    return 0
+
+def cli_contrast(args):
+    if args.preset or args.theme:
+        themes = {args.preset or args.theme: full_palette(cli_entries(args))}
+    else:
+        themes = all_themes()
+    failed = 0
+    for name, colors in themes.items():
+        bad = ContrastMatrix(colors).failures(min_ratio=args.min_ratio, min_lc=args.min_lc)
+        if bad:
+            failed += 1
+            print(f"{name}: " + "; ".join(f"{USAGE_HINTS[fg]} on {USAGE_HINTS[bg]} {ratio:.2f}:1 Lc {lc:.0f}" for fg, bg, ratio, lc in bad))
+        elif args.verbose:
+            print(f"{name}: ok")
+    floors = [f"WCAG >= {args.min_ratio:g}:1"]
+    if args.min_lc is not None: floors.append(f"|Lc| >= {args.min_lc:g}")
+    print(f"{len(themes) - failed}/{len(themes)} theme(s) pass ({', '.join(floors)})", file=sys.stderr)
+    return 1 if failed else 0
+
+def cli_presets(args):
+    for name in all_themes(): print(name)
+    return 0
+
+CLI_COMMANDS = ("apply", "export", "convert", "boot", "contrast", "presets")
+
+def build_cli():
+    parser = argparse.ArgumentParser(prog="tty_color_editor.py", description="Headless theme commands. Run without a command for the editor.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("apply", help="apply a theme file or preset to this console")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("theme", nargs="?", help="theme file (script, Xresources, kitty, alacritty, base16, Windows Terminal, iTerm2, hex)")
+    src.add_argument("-p", "--preset", help="preset name")
+    p.add_argument("-b", "--brightness", type=float, default=1.0)
+    p.add_argument("-t", "--tty", action="append", help="write to this tty/pty instead of stdout (repeatable)")
+    p.add_argument("-a", "--all-vts", action="store_true", help="write to every allocated virtual console")
+    p.add_argument("--timeout", type=float, default=TTY_WRITE_TIMEOUT, help="per-tty write timeout in seconds (default: %(default)s)")
+    p.set_defaults(func=cli_apply)
+
+    p = sub.add_parser("export", help="write a preset in another format")
+    p.add_argument("preset")
+    p.add_argument("-f", "--format", choices=sorted(THEME_EXPORTERS), default="sh")
+    p.add_argument("-o", "--output", help="output file (default: stdout)")
+    p.set_defaults(func=cli_export)
+
+    p = sub.add_parser("convert", help="convert every theme file in a directory")
+    p.add_argument("source")
+    p.add_argument("dest")
+    p.add_argument("-f", "--format", choices=sorted(THEME_EXPORTERS), default="json")
+    p.add_argument("-j", "--jobs", type=job_count, default=0, help="worker processes (default: one per core, 1: no pool)")
+    p.set_defaults(func=cli_convert)
+
+    p = sub.add_parser("boot", help="export a palette for early boot (kernel vt.default_* params, setvtrgb, systemd/initramfs)")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("theme", nargs="?", help="theme file")
+    src.add_argument("-p", "--preset", help="preset name")
+    p.add_argument("-b", "--brightness", type=float, default=1.0)
+    p.add_argument("-o", "--output", help="write cmdline.txt, vtrgb, a systemd unit and initramfs-tools scripts into this directory")
+    p.add_argument("--cmdline", default="/proc/cmdline", help="kernel command line to diff against (default: %(default)s)")
+    p.add_argument("--grub", default=GRUB_DEFAULTS, help="bootloader defaults to diff against (default: %(default)s)")
+    p.set_defaults(func=cli_boot)
+
+    p = sub.add_parser("contrast", help="check text-on-background legibility; exits 1 if any theme is below the thresholds")
+    src = p.add_mutually_exclusive_group()
+    src.add_argument("theme", nargs="?", help="theme file (default: every preset and library theme)")
+    src.add_argument("-p", "--preset", help="preset name")
+    p.add_argument("--min-ratio", type=float, default=WCAG_MIN_RATIO, help="WCAG contrast ratio (default: %(default)s; 1 turns it off)")
+    p.add_argument("--min-lc", type=float, default=APCA_MIN_LC, help="also require this absolute APCA Lc, e.g. 30 (default: off)")
+    p.add_argument("-v", "--verbose", action="store_true", help="also list themes that pass")
+    p.set_defaults(func=cli_contrast)
+
+    p = sub.add_parser("presets", help="list presets and themes from the theme library")
+    p.set_defaults(func=cli_presets)
+    return parser
+
+def pop_option(argv, name):
+    # Remove --name / --name=VALUE from argv; returns VALUE, "" for a bare flag, or None
+    value = None
+    for arg in list(argv):
+        if arg == name or arg.startswith(name + "="):
+            argv.remove(arg)
+            value = arg.partition("=")[2]
+    return value
+
+def profile_path(argv):
+    # --profile[=PATH] on the command line, or TTY_EDITOR_PROFILE=PATH (1 for the default file)
+    path = os.environ.get(PROFILE_ENV) or None
+    value = pop_option(argv, "--profile")
+    if value is not None: path = value or PROFILE_FILE
+    if path in ("1", "true", "yes"): path = PROFILE_FILE
+    return path
+
+def fade_duration(argv):
+    # --fade=SECONDS or TTY_EDITOR_FADE=SECONDS; 0 turns crossfades off
+    value = pop_option(argv, "--fade")
+    if not value: value = os.environ.get(FADE_ENV)
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return FADE_DURATION
+
 def main():
+    global PROFILER
+    if len(sys.argv) > 1 and sys.argv[1] in CLI_COMMANDS + ("-h", "--help"):
+        args = build_cli().parse_args()
+        try:
+            sys.exit(args.func(args))
+        except OSError as e: # e.g. an unwritable -o path
+            raise SystemExit(f"{e.filename or args.command}: {error_text(e)}")
+    argv = sys.argv[1:]
+    path = profile_path(argv)
+    fade = fade_duration(argv)
+    if path:
+        PROFILER = Profiler(path)
+        PROFILER.install(sys.modules[__name__])
     try:
         def start_app(stdscr):
-            app = ColorEditor(stdscr)
-            if len(sys.argv) > 1: app.load_theme_from_file(sys.argv[1])
+            app = ColorEditor(stdscr, fade_duration=fade)
+            if argv: app.load_theme_from_file(argv[0])
             app.run()
         curses.wrapper(start_app)
     except KeyboardInterrupt: pass
     except Exception as e: print(f"Error: {e}")
+    finally:
+        if PROFILER:
+            PROFILER.uninstall()
+            print(f"Profile written to {PROFILER.dump()}")
             
 if __name__ == "__main__":
     main()